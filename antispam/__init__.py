@@ -1,6 +1,8 @@
 from .antispam import AntiSpam
 
-__red_end_user_data_statement__ = "This cog does not persistently store data about users."
+__red_end_user_data_statement__ = (
+    "This cog stores the IDs of users blocked from using commands until their block ends."
+)
 
 
 async def setup(bot):
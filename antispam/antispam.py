@@ -1,20 +1,31 @@
 import asyncio
+import heapq
 import logging
-from datetime import datetime, timedelta
-from typing import Optional
+import time
+from collections import Counter
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
 
 import discord
 from redbot.core import Config, commands
 from redbot.core.commands.converter import TimedeltaConverter
 from redbot.core.utils.chat_formatting import humanize_timedelta, pagify
 
+from .limiter import RateLimiter
+from .privileges import PrivilegeCache
+
+# how often changes to the blacklist are written to Config
+SAVE_INTERVAL = 30
+# core commands that change who counts as a mod or admin in a guild
+ROLE_COMMANDS = {"set addadminrole", "set removeadminrole", "set addmodrole", "set removemodrole"}
+
 log = logging.getLogger("red.flare.antispam")
 
 
 class AntiSpam(commands.Cog):
     """Blacklist those who spam commands."""
 
-    __version__ = "0.0.10"
+    __version__ = "0.1.0"
     __author__ = "flare#0001"
 
     def format_help_for_context(self, ctx):
@@ -26,96 +37,169 @@ class AntiSpam(commands.Cog):
         self.bot = bot
         self.config = Config.get_conf(self, identifier=95932766180343808, force_registration=True)
         self.config.register_global(
-            mute_length=300, amount=5, per=5, mod_bypass=True, logging=None
+            mute_length=300,
+            amount=5,
+            per=5,
+            mod_bypass=True,
+            logging=None,
+            per_command=False,
+            per_guild=False,
+            blacklist={},
         )
-        self.cache = {}
-        self.blacklist = {}
+        self.limiter: Optional[RateLimiter] = None
+        self.privileges = PrivilegeCache()
+        self.counters = Counter()
+        # user id -> unix timestamp the blacklist ends at
+        self.blacklist: Dict[int, float] = {}
+        # (expiry, user id), entries no longer matching self.blacklist are skipped when popped
+        self.expiries: List[Tuple[float, int]] = []
+        self.wakeup = asyncio.Event()
+        self.dirty = False
         self.antispam_loop_task: Optional[asyncio.Task] = None
 
     async def red_get_data_for_user(self, *, user_id: int):
-        # this cog does not story any data
-        return {}
+        expiry = self.blacklist.get(user_id)
+        if expiry is None:
+            return {}
+        contents = f"Discord user with ID {user_id} is blocked from using commands until {time.ctime(expiry)}.\n"
+        return {"user_data.txt": BytesIO(contents.encode())}
 
     async def red_delete_data_for_user(self, *, requester, user_id: int) -> None:
-        # this cog does not story any data
-        pass
+        self.unblacklist(user_id)
+        await self.save_blacklist()
 
     def cog_unload(self):
         if self.antispam_loop_task:
             self.antispam_loop_task.cancel()
+        if self.dirty:
+            asyncio.create_task(self.save_blacklist())
 
     async def init(self):
-        self.antispam_loop_task = self.bot.loop.create_task(self.antispam_loop())
         await self.gen_cache()
+        now = time.time()
+        for user_id, expiry in self.config_cache["blacklist"].items():
+            if expiry > now:
+                self.blacklist_user(int(user_id), expiry)
+        self.dirty = False
+        self.antispam_loop_task = self.bot.loop.create_task(self.antispam_loop())
+
+    def blacklist_user(self, user_id: int, expiry: float):
+        self.blacklist[user_id] = expiry
+        heapq.heappush(self.expiries, (expiry, user_id))
+        self.dirty = True
+        # the loop may be asleep until a later expiry or with nothing to save
+        self.wakeup.set()
+
+    def unblacklist(self, user_id: int):
+        if self.blacklist.pop(user_id, None) is not None:
+            self.dirty = True
+
+    async def save_blacklist(self):
+        self.dirty = False
+        await self.config.blacklist.set(
+            {str(user_id): expiry for user_id, expiry in self.blacklist.items()}
+        )
 
     async def antispam_loop(self):
-        await self.bot.wait_until_ready()
+        """Sleep until the next blacklist ends, saving pending changes along the way."""
+        last_save = time.monotonic()
         while True:
             try:
-                to_delete = [
-                    user
-                    for user in self.blacklist
-                    if self.blacklist[user]["expiry"] < datetime.now()
-                ]
-
-                for entry in to_delete:
-                    del self.blacklist[entry]
-                await asyncio.sleep(60)
+                now = time.time()
+                while self.expiries and self.expiries[0][0] <= now:
+                    expiry, user_id = heapq.heappop(self.expiries)
+                    if self.blacklist.get(user_id) == expiry:
+                        del self.blacklist[user_id]
+                        self.dirty = True
+                        log.debug(f"{user_id} has been removed from the spam blacklist.")
+                if self.dirty and time.monotonic() - last_save >= SAVE_INTERVAL:
+                    await self.save_blacklist()
+                    last_save = time.monotonic()
+                timeout = SAVE_INTERVAL if self.dirty else None
+                if self.expiries:
+                    delay = max(self.expiries[0][0] - time.time(), 0)
+                    timeout = delay if timeout is None else min(timeout, delay)
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
             except Exception as exc:
-                log.error("Exception occured in snipe loop: ", exc_info=exc)
+                log.error("Exception occured in antispam loop: ", exc_info=exc)
                 break
 
     async def gen_cache(self):
         self.config_cache = await self.config.all()
+        if self.limiter is None:
+            self.limiter = RateLimiter(self.config_cache["amount"], self.config_cache["per"])
+        else:
+            self.limiter.configure(self.config_cache["amount"], self.config_cache["per"])
 
     def bot_check(self, ctx):
-        user = self.blacklist.get(ctx.author.id)
-        if user is None:
+        expiry = self.blacklist.get(ctx.author.id)
+        if expiry is None:
             return True
-        if self.blacklist[ctx.author.id]["expiry"] < datetime.now():
-            del self.blacklist[ctx.author.id]
+        if expiry <= time.time():
+            self.unblacklist(ctx.author.id)
             log.debug(f"{ctx.author}({ctx.author.id}) has been removed from the spam blacklist.")
             return True
         return isinstance(ctx.command, commands.commands._AlwaysAvailableCommand)
 
     @commands.Cog.listener()
     async def on_command(self, ctx):
-        if await self.bot.is_owner(ctx.author) or (
-            self.config_cache["mod_bypass"] and await self.bot.is_mod(ctx.author)
-        ):
+        privileges = await self.privileges.get(self.bot, ctx.author)
+        if privileges.owner or (self.config_cache["mod_bypass"] and privileges.mod):
+            self.counters["bypassed"] += 1
             return
         if not ctx.valid:
             return
         author = ctx.author
-        ctx.guild
-        now = datetime.now()
-        if author.id not in self.cache:
-            self.cache[author.id] = {"count": 1, "time": now}
-        else:
-            if now - self.cache[author.id]["time"] > timedelta(seconds=self.config_cache["per"]):
-                self.cache[author.id] = {"count": 1, "time": now}
-                return
-            self.cache[author.id]["count"] += 1
-            if (
-                self.cache[author.id]["count"] >= self.config_cache["amount"]
-                and author.id not in self.blacklist
-            ):
-                log.debug(
-                    f"{ctx.author}({ctx.author.id}) has been blacklisted from using commands for {self.config_cache['mute_length']} seconds."
-                )
-                expiry = datetime.now() + timedelta(seconds=self.config_cache["mute_length"])
-                self.blacklist[author.id] = {"id": author.id, "expiry": expiry}
-                await ctx.send(
-                    f"Slow down {ctx.author.mention}! You're now on a {humanize_timedelta(seconds=self.config_cache['mute_length'])} cooldown from commands.",
-                    delete_after=self.config_cache["mute_length"],
+        key = (
+            author.id,
+            ctx.guild.id if ctx.guild is not None and self.config_cache["per_guild"] else None,
+            ctx.command.qualified_name if self.config_cache["per_command"] else None,
+        )
+        if not self.limiter.hit(key):
+            self.counters["allowed"] += 1
+            return
+        self.counters["limited"] += 1
+        if author.id in self.blacklist:
+            return
+        log.debug(
+            f"{ctx.author}({ctx.author.id}) has been blacklisted from using commands for {self.config_cache['mute_length']} seconds."
+        )
+        self.blacklist_user(author.id, time.time() + self.config_cache["mute_length"])
+        await ctx.send(
+            f"Slow down {ctx.author.mention}! You're now on a {humanize_timedelta(seconds=self.config_cache['mute_length'])} cooldown from commands.",
+            delete_after=self.config_cache["mute_length"],
+        )
+        if self.config_cache.get("logging", None) is not None:
+            channel = self.bot.get_channel(self.config_cache["logging"])
+            if channel:
+                server_msg = f"{ctx.channel.mention} ({ctx.guild})" if ctx.guild else "DMs"
+                await channel.send(
+                    f"{ctx.author}({ctx.author.id}) has been blacklisted from using commands for {self.config_cache['mute_length']} seconds.\nLast command was in {server_msg}."
                 )
-                if self.config_cache.get("logging", None) is not None:
-                    channel = self.bot.get_channel(self.config_cache["logging"])
-                    if channel:
-                        server_msg = f"{ctx.channel.mention} ({ctx.guild})" if ctx.guild else "DMs"
-                        await channel.send(
-                            f"{ctx.author}({ctx.author.id}) has been blacklisted from using commands for {self.config_cache['mute_length']} seconds.\nLast command was in {server_msg}."
-                        )
+
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx):
+        if ctx.guild is not None and ctx.command.qualified_name in ROLE_COMMANDS:
+            self.privileges.invalidate_guild(ctx.guild.id)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        if before.roles != after.roles:
+            self.privileges.invalidate(after.guild.id, after.id)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        self.privileges.invalidate(member.guild.id, member.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self.privileges.invalidate_guild(role.guild.id)
 
     @commands.is_owner()
     @commands.group()
@@ -181,6 +265,26 @@ class AntiSpam(commands.Cog):
             await ctx.send("Mods and admins will no longer bypass the filter.")
         await self.gen_cache()
 
+    @antispamset.command()
+    async def percommand(self, ctx, on_or_off: bool):
+        """Toggle whether each command is rate limited separately."""
+        await self.config.per_command.set(on_or_off)
+        if on_or_off:
+            await ctx.send("Commands will now be counted separately from each other.")
+        else:
+            await ctx.send("All commands will now count towards the same limit.")
+        await self.gen_cache()
+
+    @antispamset.command()
+    async def perguild(self, ctx, on_or_off: bool):
+        """Toggle whether each server is rate limited separately."""
+        await self.config.per_guild.set(on_or_off)
+        if on_or_off:
+            await ctx.send("Commands will now be counted separately in each server.")
+        else:
+            await ctx.send("Commands in every server will now count towards the same limit.")
+        await self.gen_cache()
+
     @antispamset.command()
     async def logging(self, ctx, channel: discord.TextChannel = None):
         """Set the channel to send antispam logs."""
@@ -196,10 +300,11 @@ class AntiSpam(commands.Cog):
         """Show those currently blacklisted from using commands."""
         if not self.blacklist:
             return await ctx.send("No users currently blacklisted.")
+        now = time.time()
         msg = [
-            f"{self.bot.get_user(self.blacklist[user]['id'])}: {humanize_timedelta(timedelta=self.blacklist[user]['expiry'] - datetime.now())}"
-            for user in self.blacklist
-            if self.blacklist[user]["expiry"] > datetime.now()
+            f"{self.bot.get_user(user)}: {humanize_timedelta(seconds=expiry - now)}"
+            for user, expiry in self.blacklist.items()
+            if expiry > now
         ]
 
         if not msg:
@@ -220,15 +325,33 @@ class AntiSpam(commands.Cog):
             f"**Per** {humanize_timedelta(seconds=self.config_cache['per'])}\n"
             f"**Amount**: {self.config_cache['amount']}\n"
             f"**Mod/Admin Bypass**: {'Yes' if self.config_cache['mod_bypass'] else 'No'}\n"
+            f"**Per Command**: {'Yes' if self.config_cache['per_command'] else 'No'}\n"
+            f"**Per Server**: {'Yes' if self.config_cache['per_guild'] else 'No'}\n"
             f"**Logging**: {'Yes - {}'.format(channel.mention) if channel else 'No'}"
         )
         await ctx.maybe_send_embed(msg)
 
+    @antispamset.command()
+    async def stats(self, ctx):
+        """Show how many commands were allowed, limited or bypassed since the cog loaded."""
+        lookups = self.privileges.hits + self.privileges.misses
+        msg = (
+            f"**Allowed**: {self.counters['allowed']}\n"
+            f"**Limited**: {self.counters['limited']}\n"
+            f"**Bypassed**: {self.counters['bypassed']}\n"
+            f"**Tracked Buckets**: {len(self.limiter)}\n"
+            f"**Cached Privileges**: {len(self.privileges)}"
+            f" ({self.privileges.hits / lookups if lookups else 0:.0%} hit rate)\n"
+            f"**Blacklisted Users**: {len(self.blacklist)}"
+        )
+        await ctx.maybe_send_embed(msg)
+
     @antispamset.command()
     async def remove(self, ctx, user: discord.Member):
         """Remove a user from the anti-spam blacklist."""
         if user.id in self.blacklist:
-            del self.blacklist[user.id]
+            self.unblacklist(user.id)
+            await self.save_blacklist()
             await ctx.tick()
             return
         await ctx.send(f"{user} isn't blocked from using commands.")
@@ -237,6 +360,8 @@ class AntiSpam(commands.Cog):
     async def clear(self, ctx):
         """Clear the antispam list."""
         self.blacklist = {}
+        self.expiries = []
+        await self.save_blacklist()
         await ctx.tick()
 
     @antispamset.command()
@@ -244,7 +369,8 @@ class AntiSpam(commands.Cog):
         self, ctx, users: commands.Greedy[discord.Member], *, length: TimedeltaConverter
     ):
         """Manually blacklist a user for a set time."""
-        expiry = datetime.now() + length
+        expiry = time.time() + length.total_seconds()
         for user in users:
-            self.blacklist[user.id] = {"id": user.id, "expiry": expiry}
+            self.blacklist_user(user.id, expiry)
+        await self.save_blacklist()
         await ctx.tick()
@@ -0,0 +1,69 @@
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+# buckets tracked at once, the least recently used is dropped beyond this
+MAX_BUCKETS = 100_000
+
+
+class Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float) -> None:
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    """Token buckets that allow ``amount`` commands per ``per`` seconds.
+
+    A full bucket behaves exactly like a missing one, so buckets are dropped once they have
+    been idle long enough to refill and the least recently used one is evicted when
+    ``maxsize`` is reached. Every check is O(1) amortised.
+    """
+
+    def __init__(self, amount: int, per: float, maxsize: int = MAX_BUCKETS) -> None:
+        self.maxsize = maxsize
+        self.buckets: "OrderedDict[Hashable, Bucket]" = OrderedDict()
+        self.configure(amount, per)
+
+    def configure(self, amount: int, per: float):
+        # the amount-th command within the period is the one that gets limited
+        capacity = max(amount - 1, 1)
+        rate = amount / per
+        if getattr(self, "capacity", None) == capacity and getattr(self, "rate", None) == rate:
+            return
+        self.capacity = capacity
+        self.rate = rate
+        self.refill_time = capacity / rate
+        self.buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self.buckets)
+
+    def _expire(self, now: float):
+        buckets = self.buckets
+        while buckets:
+            bucket = next(iter(buckets.values()))
+            if now - bucket.updated < self.refill_time:
+                return
+            buckets.popitem(last=False)
+
+    def hit(self, key: Hashable, now: Optional[float] = None) -> bool:
+        """Take a token from ``key``'s bucket, returning whether it was rate limited."""
+        if now is None:
+            now = time.monotonic()
+        self._expire(now)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.maxsize:
+                self.buckets.popitem(last=False)
+            self.buckets[key] = Bucket(self.capacity - 1, now)
+            return False
+        self.buckets.move_to_end(key)
+        bucket.tokens = min(self.capacity, bucket.tokens + (now - bucket.updated) * self.rate)
+        bucket.updated = now
+        if bucket.tokens < 1:
+            return True
+        bucket.tokens -= 1
+        return False
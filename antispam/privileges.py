@@ -0,0 +1,65 @@
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+# users tracked at once and how long a lookup is trusted for, the latter covers any role
+# or owner change no event tells us about
+MAX_ENTRIES = 50_000
+TTL = 600
+
+
+class Privileges(NamedTuple):
+    owner: bool
+    mod: bool
+    expires: float
+    generation: int
+
+
+class PrivilegeCache:
+    """Owner and mod/admin status per (guild, user), kept for ``ttl`` seconds.
+
+    Single users are invalidated directly, whole guilds by bumping a generation counter so
+    that their entries are refreshed the next time they are looked up.
+    """
+
+    def __init__(self, maxsize: int = MAX_ENTRIES, ttl: float = TTL) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: "OrderedDict[Tuple[Optional[int], int], Privileges]" = OrderedDict()
+        self.generations: Dict[Optional[int], int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    async def get(self, bot, user) -> Privileges:
+        guild = getattr(user, "guild", None)
+        guild_id = guild.id if guild is not None else None
+        key = (guild_id, user.id)
+        generation = self.generations.get(guild_id, 0)
+        now = time.monotonic()
+        entry = self.entries.get(key)
+        if entry is not None and entry.expires > now and entry.generation == generation:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+        self.misses += 1
+        owner = await bot.is_owner(user)
+        mod = guild is not None and await bot.is_mod(user)
+        entry = Privileges(owner, mod, now + self.ttl, generation)
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, guild_id: Optional[int], user_id: int):
+        self.entries.pop((guild_id, user_id), None)
+
+    def invalidate_guild(self, guild_id: Optional[int]):
+        self.generations[guild_id] = self.generations.get(guild_id, 0) + 1
+
+    def clear(self):
+        self.entries.clear()
+        self.generations.clear()
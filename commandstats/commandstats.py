@@ -1,17 +1,36 @@
 import asyncio
 import datetime
 import logging
+import time
+import weakref
 from collections import OrderedDict
 from copy import deepcopy
-from io import StringIO
+from functools import partial
 from typing import Counter, Optional
 
 import discord
-import pandas
 from redbot.cogs.downloader.repo_manager import Repo
 from redbot.core import Config, commands
+from redbot.core.commands.converter import TimedeltaConverter
+from redbot.core.data_manager import cog_data_path
+from redbot.core.utils.chat_formatting import box, humanize_timedelta
 
-from .menus import EmbedFormat, GenericMenu, LeaderboardSource
+from .converter import ExportArgs
+from .export import COLUMNS, command_filter, counter_rows, guild_rows, usage_rows, write_rows
+from .journal import DeltaJournal
+from .latency import LatencyHistogram, humanize_seconds
+from .menus import EmbedFormat, GenericMenu, LatencySource, LeaderboardSource
+from .metrics import MetricsServer
+from .usage import DAY, HOUR, WEEK, UsageStore, bucket_of
+
+SPARKS = "▁▂▃▄▅▆▇█"
+# flushes appended to the journal before it is folded back into Config
+COMPACT_EVERY = 20
+
+
+def sparkline(values):
+    peak = max(values) or 1
+    return "".join(SPARKS[round(value / peak * (len(SPARKS) - 1))] for value in values)
 
 
 def chunks(l, n):
@@ -30,7 +49,7 @@ async def downloadercheck(ctx):
 class CommandStats(commands.Cog):
     """Command Statistics."""
 
-    __version__ = "0.1.5"
+    __version__ = "0.2.0"
 
     def format_help_for_context(self, ctx):
         """Thanks Sinbad."""
@@ -40,11 +59,40 @@ class CommandStats(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.config = Config.get_conf(self, 1398467138476, force_registration=True)
-        default_global = {"globaldata": Counter({}), "guilddata": {}, "automated": Counter({})}
+        default_global = {
+            "globaldata": Counter({}),
+            "guilddata": {},
+            "automated": Counter({}),
+            "journal_seq": 0,
+            "metrics_enabled": False,
+            "metrics_host": "127.0.0.1",
+            "metrics_port": 9466,
+        }
         self.config.register_global(**default_global)
         self.cache = {"guild": {}, "session": Counter({}), "automated": Counter({})}
+        self.totals = None
+        self.seq = 0
+        self.flushes = 0
+        self.flush_lock = asyncio.Lock()
+        self._ready = asyncio.Event()
+        self.journal = DeltaJournal(cog_data_path(self) / "journal.jsonl")
+        # qualified command name -> cog name -> repo name, rebuilt as cogs load and unload
+        self.command_cogs = {}
+        self.cog_commands = {}
+        self.cog_repos = {}
+        self.cog_totals = Counter()
+        self.session_cogs = Counter()
+        self.repo_totals = Counter()
+        # start of each running invocation, closed by the completion or error event
+        self.timings = weakref.WeakKeyDictionary()
+        self.latency = {}
+        self.errors = {}
+        self.guild_sums = Counter()
+        self.metrics_server = MetricsServer(self)
         self.session = Counter()
         self.session_time = datetime.datetime.utcnow()
+        self.series = Counter()
+        self.usage = UsageStore(cog_data_path(self) / "usage.db")
         self.bg_loop_task = self.bot.loop.create_task(self.bg_loop())
 
     async def red_get_data_for_user(self, *, user_id: int):
@@ -56,11 +104,17 @@ class CommandStats(commands.Cog):
         pass
 
     async def bg_loop(self):
+        await self.load_totals()
+        try:
+            await self.start_metrics()
+        except OSError as exc:
+            log.error("Couldn't start the metrics endpoint: ", exc_info=exc)
         await self.bot.wait_until_ready()
+        await self.rebuild_index()
         while True:
             try:
-                await self.update_global()
-                await self.update_data()
+                await self.flush()
+                await self.update_series()
                 await asyncio.sleep(180)
             except Exception as exc:
                 log.error("Exception in bg_loop: ", exc_info=exc)
@@ -69,8 +123,10 @@ class CommandStats(commands.Cog):
     def cog_unload(self):
         if self.bg_loop_task:
             self.bg_loop_task.cancel()
-        asyncio.create_task(self.update_data())
-        asyncio.create_task(self.update_global())
+        if self.totals is not None:
+            asyncio.create_task(self.flush())
+        asyncio.create_task(self.close_usage())
+        asyncio.create_task(self.metrics_server.stop())
 
     def record(
         self, name: str, guild: Optional[discord.Guild] = None, automated: Optional[bool] = None
@@ -81,7 +137,9 @@ class CommandStats(commands.Cog):
             else:
                 self.cache["automated"][name] += 1
             return
+        self.series[(bucket_of(time.time(), HOUR), name, guild.id if guild else 0)] += 1
         if guild is not None:
+            self.guild_sums[str(guild.id)] += 1
             if str(guild.id) not in self.cache["guild"]:
                 self.cache["guild"][str(guild.id)] = Counter({})
             if name not in self.cache["guild"][str(guild.id)]:
@@ -96,10 +154,92 @@ class CommandStats(commands.Cog):
             self.session[name] = 1
         else:
             self.session[name] += 1
+        cog = self.command_cogs.get(name)
+        if cog is not None:
+            self.cog_totals[cog] += 1
+            self.session_cogs[cog] += 1
+            repo = self.cog_repos.get(cog)
+            if repo is not None:
+                self.repo_totals[repo] += 1
+
+    @commands.Cog.listener()
+    async def on_cog_add(self, cog):
+        await self.rebuild_index()
+
+    @commands.Cog.listener()
+    async def on_cog_remove(self, cog):
+        await self.rebuild_index()
+
+    async def rebuild_index(self):
+        """Map every loaded command to its cog and repo and recount the per cog totals."""
+        await self._ready.wait()
+        installed = {}
+        downloader = self.bot.get_cog("Downloader")
+        if downloader is not None:
+            installed = {cog.name: cog.repo_name for cog in await downloader.installed_cogs()}
+        # nothing below awaits so no command can be recorded while the totals are rebuilt
+        command_cogs, cog_commands = {}, {}
+        for cogname, cog in self.bot.cogs.items():
+            cog_commands[cogname] = {x.qualified_name for x in cog.walk_commands()}
+            for command in cog_commands[cogname]:
+                command_cogs[command] = cogname
+        cog_repos = {
+            cogname: installed[cogname.lower()]
+            for cogname in self.bot.cogs
+            if cogname.lower() in installed
+        }
+        cog_totals, session_cogs, repo_totals = Counter(), Counter(), Counter()
+        for data, counter in (
+            (self.totals["global"] + self.cache["session"], cog_totals),
+            (self.session, session_cogs),
+        ):
+            for command, amount in data.items():
+                if command in command_cogs:
+                    counter[command_cogs[command]] += amount
+        for cogname, amount in cog_totals.items():
+            if cogname in cog_repos:
+                repo_totals[cog_repos[cogname]] += amount
+        self.command_cogs, self.cog_commands, self.cog_repos = (
+            command_cogs,
+            cog_commands,
+            cog_repos,
+        )
+        self.cog_totals, self.session_cogs, self.repo_totals = (
+            cog_totals,
+            session_cogs,
+            repo_totals,
+        )
+
+    def finish_timing(self, ctx) -> Optional[str]:
+        start = self.timings.pop(ctx, None)
+        if start is None or ctx.command is None:
+            return None
+        name = ctx.command.qualified_name
+        if name not in self.latency:
+            self.latency[name] = LatencyHistogram()
+        self.latency[name].observe(time.perf_counter() - start)
+        return name
+
+    @commands.Cog.listener()
+    async def on_command(self, ctx):
+        self.timings[ctx] = time.perf_counter()
+
+    @commands.Cog.listener()
+    async def on_command_error(self, ctx, error):
+        """Record how long failed invocations took and what they failed with."""
+        name = self.finish_timing(ctx)
+        if name is None:
+            return
+        if isinstance(error, commands.CommandInvokeError):
+            error = error.original
+        if name not in self.errors:
+            self.errors[name] = Counter()
+        self.errors[name][type(error).__name__] += 1
 
     @commands.Cog.listener()
     async def on_command_completion(self, ctx):
         """Record standard command events."""
+        self.finish_timing(ctx)
         if not ctx.valid:
             return
         if ctx.message.author.bot:
@@ -136,8 +276,7 @@ class CommandStats(commands.Cog):
 
         This command does not log the issuing command.
         """
-        await self.update_global()
-        data = await self.config.globaldata()
+        data = await self.global_totals()
         if not data:
             return await ctx.send("No commands have been used yet.")
         if command is None:
@@ -161,8 +300,7 @@ class CommandStats(commands.Cog):
         """Automated command stats.
 
         Commands that have `ctx.assume_yes` will qualify as automated."""
-        await self.update_global()
-        data = await self.config.automated()
+        data = await self.automated_totals()
         if not data:
             return await ctx.send("No commands have been used yet.")
         await GenericMenu(
@@ -186,11 +324,8 @@ class CommandStats(commands.Cog):
         """Guild Command Stats."""
         if not server:
             server = ctx.guild
-        await self.update_data()
-        data = await self.config.guilddata()
-        try:
-            data = data[str(server.id)]
-        except KeyError:
+        data = await self.guild_totals(server.id)
+        if not data:
             return await ctx.send(f"No commands have been used in {server.name} yet.")
         if command is None:
             await GenericMenu(
@@ -242,15 +377,12 @@ class CommandStats(commands.Cog):
     @cmd.group(invoke_without_command=True)
     async def cogstats(self, ctx, *, cogname: str = None):
         """Show command stats per cog, all cogs or per session."""
-        await self.update_global()
+        data = await self.global_totals()
         if cogname is not None:
-            cog = self.bot.get_cog(cogname)
-            if cog is None:
+            if cogname not in self.cog_commands:
                 await ctx.send("No such cog.")
                 return
-            commands = {x.qualified_name for x in cog.walk_commands()}
-            data = await self.config.globaldata()
-            a = {command: data[command] for command in data if command in commands}
+            a = {command: data[command] for command in self.cog_commands[cogname] if data[command]}
             if not a:
                 await ctx.send(f"No commands used from {cogname} as of yet.")
                 return
@@ -264,12 +396,7 @@ class CommandStats(commands.Cog):
                 wait=False,
             )
         else:
-            data = await self.config.globaldata()
-            a = {}
-            for cogn in self.bot.cogs:
-                cog = self.bot.get_cog(cogn)
-                commands = {x.qualified_name for x in cog.walk_commands()}
-                a[cogn] = sum(data[command] for command in data if command in commands)
+            a = {cogn: self.cog_totals[cogn] for cogn in self.cog_commands}
             if not a:
                 await ctx.send("No commands used from any cog as of yet.")
                 return
@@ -286,15 +413,15 @@ class CommandStats(commands.Cog):
     @cogstats.command(name="session")
     async def _session(self, ctx, *, cogname: str = None):
         """Cog stats in this session."""
-        await self.update_global()
         if cogname is not None:
-            cog = self.bot.get_cog(cogname)
-            if cog is None:
+            if cogname not in self.cog_commands:
                 await ctx.send("No such cog.")
                 return
-            commands = {x.qualified_name for x in cog.walk_commands()}
-            data = deepcopy(self.session)
-            a = {command: data[command] for command in data if command in commands}
+            a = {
+                command: self.session[command]
+                for command in self.cog_commands[cogname]
+                if self.session[command]
+            }
             if not a:
                 await ctx.send(f"No commands used from {cogname} as of yet.")
                 return
@@ -309,12 +436,7 @@ class CommandStats(commands.Cog):
                 wait=False,
             )
         else:
-            data = deepcopy(self.session)
-            a = {}
-            for cogn in self.bot.cogs:
-                cog = self.bot.get_cog(cogn)
-                commands = {x.qualified_name for x in cog.walk_commands()}
-                a[cogn] = sum(data[command] for command in data if command in commands)
+            a = {cogn: self.session_cogs[cogn] for cogn in self.cog_commands}
             if not a:
                 await ctx.send("No commands used from any cog as of yet.")
                 return
@@ -323,31 +445,266 @@ class CommandStats(commands.Cog):
                 title="Cogs Statistics During Session",
                 _type="Cog",
                 ctx=ctx,
+                timestamp=self.session_time,
+            ).start(
+                ctx=ctx,
+                wait=False,
+            )
+
+    @cmd.command()
+    async def top(
+        self,
+        ctx,
+        window: TimedeltaConverter(
+            minimum=datetime.timedelta(hours=1), default_unit="hours"
+        ) = datetime.timedelta(hours=24),
+        server: Optional[commands.GuildConverter] = None,
+    ):
+        """Most used commands over a recent window of time.
+
+        Examples:
+            `[p]cmd top 24h`
+            `[p]cmd top 7 days`
+        """
+        since = time.time() - window.total_seconds()
+        data = await self.usage.top(
+            since, guild=server.id if server else None, pending=self.series
+        )
+        period = humanize_timedelta(timedelta=window)
+        if not data:
+            return await ctx.send(f"No commands have been used in the last {period}.")
+        title = f"Top Commands in the last {period}"
+        if server is not None:
+            title += f" in {server.name}"
+        await GenericMenu(
+            source=EmbedFormat(self.build_data(dict(data))),
+            title=title,
+            _type="Command",
+            ctx=ctx,
+        ).start(
+            ctx=ctx,
+            wait=False,
+        )
+
+    @cmd.command()
+    async def trend(self, ctx, *, command: str):
+        """Hourly and daily usage of a command."""
+        hourly = await self.usage.trend(command, HOUR, 24, pending=self.series)
+        daily = await self.usage.trend(command, DAY, 14, pending=self.series)
+        if not any(count for _, count in daily):
+            return await ctx.send(f"`{command}` hasn't been used in the last 14 days!")
+        embed = discord.Embed(title=f"Usage trend for {command}", color=await ctx.embed_color())
+        for name, series in (("Last 24 hours", hourly), ("Last 14 days", daily)):
+            counts = [count for _, count in series]
+            embed.add_field(
+                name=f"{name} ({sum(counts)} uses, peak {max(counts)})",
+                value=box(sparkline(counts)),
+                inline=False,
+            )
+        embed.set_footer(text="Oldest to newest")
+        await ctx.send(embed=embed)
+
+    @cmd.command()
+    async def latency(self, ctx, *, command: str = None):
+        """Command latency percentiles and errors during this session.
+
+        Without a command, the slowest commands by p95 are listed."""
+        if command is None:
+            if not self.latency:
+                return await ctx.send("No commands have been timed in this session.")
+            rows = [
+                [
+                    name,
+                    histogram.count,
+                    humanize_seconds(histogram.percentile(50)),
+                    humanize_seconds(histogram.percentile(95)),
+                    humanize_seconds(histogram.percentile(99)),
+                    sum(self.errors.get(name, {}).values()),
+                ]
+                for name, histogram in sorted(
+                    self.latency.items(), key=lambda t: t[1].percentile(95), reverse=True
+                )
+            ]
+            return await GenericMenu(
+                source=LatencySource(list(chunks(rows, 15))),
+                title="Command Latency",
+                ctx=ctx,
+                timestamp=self.session_time,
             ).start(
                 ctx=ctx,
                 wait=False,
             )
+        histogram = self.latency.get(command)
+        if histogram is None:
+            return await ctx.send(f"`{command}` hasn't been timed in this session!")
+        embed = discord.Embed(title=f"Latency for {command}", color=await ctx.embed_color())
+        embed.add_field(
+            name=f"{histogram.count} use{'s' if histogram.count != 1 else ''}",
+            value=box(
+                "\n".join(
+                    f"{label:<5}{humanize_seconds(value)}"
+                    for label, value in (
+                        ("p50", histogram.percentile(50)),
+                        ("p95", histogram.percentile(95)),
+                        ("p99", histogram.percentile(99)),
+                        ("mean", histogram.mean),
+                        ("max", histogram.maximum),
+                    )
+                ),
+                lang="prolog",
+            ),
+        )
+        errors = self.errors.get(command)
+        if errors:
+            embed.add_field(
+                name=f"{sum(errors.values())} error{'s' if sum(errors.values()) != 1 else ''}",
+                value=box(
+                    "\n".join(f"{amount} {error}" for error, amount in errors.most_common(10))
+                ),
+            )
+        embed.set_footer(text="Recording commands since")
+        embed.timestamp = self.session_time
+        await ctx.send(embed=embed)
+
+    @cmd.group()
+    async def metrics(self, ctx):
+        """Expose command stats to Prometheus over HTTP."""
+
+    @metrics.command(name="toggle")
+    async def metrics_toggle(self, ctx, enabled: bool):
+        """Start or stop the OpenMetrics endpoint."""
+        await self.config.metrics_enabled.set(enabled)
+        if not enabled:
+            await self.metrics_server.stop()
+            return await ctx.send("Metrics endpoint stopped.")
+        try:
+            await self.start_metrics()
+        except OSError as exc:
+            return await ctx.send(f"Couldn't start the metrics endpoint: {exc}")
+        await ctx.send(f"Serving metrics on {await self.metrics_url()}")
+
+    @metrics.command(name="address")
+    async def metrics_address(self, ctx, host: str, port: int):
+        """Set the address the endpoint listens on.
+
+        Use `127.0.0.1` unless Prometheus runs on another machine, the endpoint has no authentication."""
+        if not 0 < port < 65536:
+            return await ctx.send("Port must be between 1 and 65535.")
+        await self.config.metrics_host.set(host)
+        await self.config.metrics_port.set(port)
+        if not await self.config.metrics_enabled():
+            return await ctx.send(
+                f"Address set, turn the endpoint on with `{ctx.clean_prefix}cmd metrics toggle true`."
+            )
+        try:
+            await self.start_metrics()
+        except OSError as exc:
+            return await ctx.send(f"Couldn't start the metrics endpoint: {exc}")
+        await ctx.send(f"Serving metrics on {await self.metrics_url()}")
+
+    async def start_metrics(self):
+        if not await self.config.metrics_enabled():
+            return
+        await self.metrics_server.start(
+            await self.config.metrics_host(), await self.config.metrics_port()
+        )
+
+    async def metrics_url(self) -> str:
+        return (
+            f"http://{await self.config.metrics_host()}:{await self.config.metrics_port()}/metrics"
+        )
 
     @cmd.command()
     async def csv(self, ctx):
         """Return a CSV of all command actions."""
-        await self.update_global()
-        data = await self.config.globaldata()
-        df = pandas.DataFrame.from_dict(data, orient="index", columns=["Usage"])
-        df.index.name = "Commands"
-        s_buf = StringIO()
-        df.to_csv(s_buf)
-        s_buf.name = "commandstats.csv"
-        s_buf.seek(0)
-        await ctx.send(file=discord.File(s_buf))
+        await self.send_export(ctx, await ExportArgs().convert(ctx, "global"))
+
+    @cmd.command()
+    async def export(self, ctx, *, arguments: ExportArgs):
+        """Export command stats as CSV, JSON lines or Parquet.
+
+        Datasets are `global`, `guild`, `automated` and `usage`, the hourly, daily or weekly usage history.
+
+        Options:
+        `--format csv|jsonl|parquet` - Parquet needs pyarrow installed.
+        `--guild <id>` - Only this guild.
+        `--cog <name>` - Only commands from this cog.
+        `--prefix <text>` - Only commands starting with this text.
+        `--since <YYYY-MM-DD>` and `--until <YYYY-MM-DD>` - Date range, `usage` only.
+        `--resolution hour|day|week` - Bucket size for `usage`, hourly buckets are kept for 14 days.
+
+        Example: `[p]cmd export usage --format jsonl --cog Trigger --since 2021-01-01`
+        """
+        await self.send_export(ctx, arguments)
+
+    async def send_export(self, ctx, args):
+        keep = command_filter(
+            self.cog_commands.get(args["cog"], ()) if args["cog"] else None, args["prefix"]
+        )
+        exports = cog_data_path(self) / "exports"
+        exports.mkdir(exist_ok=True)
+        path = exports / f"commandstats-{args['dataset']}-{int(time.time())}.{args['format']}"
+        write = partial(write_rows, path, args["format"], COLUMNS[args["dataset"]])
+        async with ctx.typing():
+            try:
+                if args["dataset"] == "usage":
+                    await self.update_series()
+                    resolution = args["resolution"]
+                    written = await self.usage.export(
+                        lambda rows: write(usage_rows(rows, resolution, keep)),
+                        {"hour": HOUR, "day": DAY, "week": WEEK}[resolution],
+                        since=args["since"].timestamp() if args["since"] else None,
+                        until=args["until"].timestamp() if args["until"] else None,
+                        guild=args["guild"],
+                    )
+                else:
+                    if args["dataset"] == "global":
+                        rows = counter_rows(await self.global_totals(), keep)
+                    elif args["dataset"] == "automated":
+                        rows = counter_rows(await self.automated_totals(), keep)
+                    else:
+                        await self._ready.wait()
+                        if args["guild"] is not None:
+                            guilds = [str(args["guild"])]
+                        else:
+                            guilds = self.totals["guild"].keys() | self.cache["guild"].keys()
+                        # merged on the event loop so the writer thread never sees them change
+                        data = {
+                            guild: self.totals["guild"].get(guild, Counter())
+                            + self.cache["guild"].get(guild, Counter())
+                            for guild in guilds
+                        }
+                        rows = guild_rows(data, keep)
+                    written = await asyncio.get_running_loop().run_in_executor(None, write, rows)
+            except Exception:
+                path.unlink(missing_ok=True)
+                raise
+        if not written:
+            path.unlink(missing_ok=True)
+            return await ctx.send("No data matches those filters.")
+        limit = ctx.guild.filesize_limit if ctx.guild else 8 * 1024 * 1024
+        if path.stat().st_size > limit:
+            return await ctx.send(
+                f"Exported {written} rows but the file is too large to upload, it was saved to `{path}`."
+            )
+        await ctx.send(
+            f"Exported {written} row{'s' if written != 1 else ''}.", file=discord.File(str(path))
+        )
+        path.unlink(missing_ok=True)
 
     @cmd.command()
     @commands.is_owner()
     async def guilds(self, ctx):
         """Leaderboard of guilds by most commands used."""
-        await self.update_data()
-        data = await self.config.guilddata()
-        guildata = [(k, sum(data[k].values())) for k in data]
+        await self._ready.wait()
+        guildata = [
+            (
+                k,
+                sum(self.totals["guild"].get(k, {}).values())
+                + sum(self.cache["guild"].get(k, {}).values()),
+            )
+            for k in self.totals["guild"].keys() | self.cache["guild"].keys()
+        ]
         await GenericMenu(
             source=LeaderboardSource(sorted(guildata, key=lambda x: x[1], reverse=True)),
             ctx=ctx,
@@ -361,23 +718,13 @@ class CommandStats(commands.Cog):
     @commands.check(downloadercheck)
     async def repo(self, ctx, repo: Repo = None):
         """Show command stats per Repo or by repo."""
-        cog = self.bot.get_cog("Downloader")
-        all_installed_cogs = await cog.installed_cogs()
-        await self.update_global()
-        data = await self.config.globaldata()
+        await self._ready.wait()
         if repo is not None:
-            installed_cogs_in_repo = [
-                cog.name for cog in all_installed_cogs if cog.repo_name == repo.name
-            ]
-            installed_cogs = [
-                (self.bot.cogs[cog], cog)
-                for cog in self.bot.cogs
-                if cog.lower() in installed_cogs_in_repo
-            ]
-            a = {}
-            for cog, cogname in installed_cogs:
-                commands = {x.qualified_name for x in cog.walk_commands()}
-                a[cogname] = sum(data[command] for command in data if command in commands)
+            a = {
+                cogname: self.cog_totals[cogname]
+                for cogname, repo_name in self.cog_repos.items()
+                if repo_name == repo.name
+            }
             if not a:
                 await ctx.send(f"No commands used from any cog in {repo.name} as of yet.")
                 return
@@ -391,16 +738,7 @@ class CommandStats(commands.Cog):
                 wait=False,
             )
         else:
-            installed_cogs_in_repo = {cog.name: cog.repo_name for cog in all_installed_cogs}
-            installed_cogs = [
-                (self.bot.cogs[cog], cog, installed_cogs_in_repo[cog.lower()])
-                for cog in self.bot.cogs
-                if cog.lower() in installed_cogs_in_repo
-            ]
-            a = {installed_cogs_in_repo[repo]: 0 for repo in installed_cogs_in_repo}
-            for cog, cogname, repo in installed_cogs:
-                commands = {x.qualified_name for x in cog.walk_commands()}
-                a[repo] += sum(data[command] for command in data if command in commands)
+            a = {repo: self.repo_totals[repo] for repo in set(self.cog_repos.values())}
             if not a:
                 await ctx.send("No commands used from any repos as of yet.")
                 return
@@ -414,8 +752,7 @@ class CommandStats(commands.Cog):
     @cmd.command()
     async def search(self, ctx, *, command: str):
         """Search for command stats"""
-        await self.update_global()
-        data = await self.config.globaldata()
+        data = await self.global_totals()
         if not data:
             return await ctx.send("No commands have been used yet.")
         new_data = Counter({})
@@ -435,21 +772,100 @@ class CommandStats(commands.Cog):
             wait=False,
         )
 
-    async def update_data(self):
-        async with self.config.guilddata() as guilddata:
-            for guild in self.cache["guild"]:
-                olddata = Counter(guilddata[guild]) if guild in guilddata else Counter({})
-                data = Counter(olddata + self.cache["guild"][guild])
-                self.cache["guild"][guild] = Counter()
-                guilddata[guild] = data
-
-    async def update_global(self):
-        globaldata = await self.config.globaldata()
-        data = globaldata + self.cache["session"]
-        await self.config.globaldata.set(data)
-        self.cache["session"] = Counter({})
-
-        autodata = await self.config.automated()
-        data = autodata + self.cache["automated"]
-        await self.config.automated.set(data)
-        self.cache["automated"] = Counter({})
+    async def update_series(self):
+        series, self.series = self.series, Counter()
+        await self.usage.add(series)
+
+    async def close_usage(self):
+        await self.update_series()
+        self.usage.close()
+
+    async def load_totals(self):
+        """Load the compacted totals from Config and replay the journal on top."""
+        try:
+            data = await self.config.all()
+            totals = {
+                "global": Counter(data["globaldata"]),
+                "automated": Counter(data["automated"]),
+                "guild": {guild: Counter(counts) for guild, counts in data["guilddata"].items()},
+            }
+            self.seq = data["journal_seq"]
+            for entry in await self.journal.replay(self.seq):
+                try:
+                    self.merge(totals, entry)
+                except (AttributeError, TypeError, ValueError):
+                    log.warning(f"Skipping malformed journal entry {entry['seq']}.")
+                self.seq = entry["seq"]
+                self.flushes += 1
+            for guild, counts in totals["guild"].items():
+                self.guild_sums[guild] += sum(counts.values())
+            self.totals = totals
+        except Exception as exc:
+            log.exception("Failed to load command totals.", exc_info=exc)
+            raise
+        finally:
+            # waiters must not hang forever, they fail on the missing totals instead
+            self._ready.set()
+
+    @staticmethod
+    def merge(totals, entry):
+        totals["global"].update(entry.get("global", {}))
+        totals["automated"].update(entry.get("automated", {}))
+        for guild, counts in entry.get("guild", {}).items():
+            totals["guild"].setdefault(guild, Counter()).update(counts)
+
+    async def flush(self):
+        """Append the deltas recorded since the last flush to the journal.
+
+        Only commands used since the last flush are written, the full totals are only
+        rewritten to Config every ``COMPACT_EVERY`` flushes.
+        """
+        async with self.flush_lock:
+            entry = {}
+            session, self.cache["session"] = self.cache["session"], Counter()
+            automated, self.cache["automated"] = self.cache["automated"], Counter()
+            guilds, self.cache["guild"] = self.cache["guild"], {}
+            if session:
+                entry["global"] = dict(session)
+            if automated:
+                entry["automated"] = dict(automated)
+            guilds = {guild: dict(counts) for guild, counts in guilds.items() if counts}
+            if guilds:
+                entry["guild"] = guilds
+            if not entry:
+                return
+            self.seq += 1
+            entry["seq"] = self.seq
+            # merged before the write so reads never miss the swapped out deltas
+            self.merge(self.totals, entry)
+            await self.journal.append(entry)
+            self.flushes += 1
+            if self.flushes >= COMPACT_EVERY:
+                await self.compact()
+
+    async def compact(self):
+        # a single write, so the totals are never saved without the sequence they include
+        async with self.config.all() as data:
+            data["globaldata"] = dict(self.totals["global"])
+            data["automated"] = dict(self.totals["automated"])
+            data["guilddata"] = {
+                guild: dict(counts) for guild, counts in self.totals["guild"].items()
+            }
+            data["journal_seq"] = self.seq
+        await self.journal.truncate()
+        self.flushes = 0
+
+    async def global_totals(self) -> Counter:
+        await self._ready.wait()
+        return self.totals["global"] + self.cache["session"]
+
+    async def automated_totals(self) -> Counter:
+        await self._ready.wait()
+        return self.totals["automated"] + self.cache["automated"]
+
+    async def guild_totals(self, guild_id: int) -> Counter:
+        await self._ready.wait()
+        guild = str(guild_id)
+        return self.totals["guild"].get(guild, Counter()) + self.cache["guild"].get(
+            guild, Counter()
+        )
@@ -0,0 +1,65 @@
+import argparse
+import datetime
+import importlib.util
+
+from redbot.core.commands import BadArgument, Converter
+
+from .export import DATASETS, FORMATS
+
+RESOLUTIONS = ("hour", "day", "week")
+
+
+class NoExitParser(argparse.ArgumentParser):
+    def error(self, message):
+        raise BadArgument()
+
+
+def parse_date(value: str) -> datetime.datetime:
+    try:
+        date = datetime.date.fromisoformat(value)
+    except ValueError:
+        raise BadArgument(f"`{value}` isn't a date, use the YYYY-MM-DD format.")
+    return datetime.datetime(date.year, date.month, date.day, tzinfo=datetime.timezone.utc)
+
+
+class ExportArgs(Converter):
+    async def convert(self, ctx, argument):
+        argument = argument.replace("—", "--")
+        parser = NoExitParser(description="Export command stats", add_help=False)
+        parser.add_argument("dataset", choices=DATASETS)
+        parser.add_argument("--format", "--f", dest="format", default="csv", choices=FORMATS)
+        parser.add_argument("--guild", "--g", dest="guild", default=None, type=int)
+        parser.add_argument("--cog", "--c", dest="cog", default=None)
+        parser.add_argument("--prefix", "--p", dest="prefix", default=None, nargs="*")
+        parser.add_argument("--since", dest="since", default=None)
+        parser.add_argument("--until", dest="until", default=None)
+        parser.add_argument(
+            "--resolution", "--r", dest="resolution", default="day", choices=RESOLUTIONS
+        )
+
+        try:
+            vals = vars(parser.parse_args(argument.split()))
+        except Exception as error:
+            raise BadArgument(
+                "Could not parse flags correctly, ensure flags are correctly used."
+            ) from error
+
+        if vals["prefix"] is not None:
+            vals["prefix"] = " ".join(vals["prefix"])
+        if vals["format"] == "parquet" and importlib.util.find_spec("pyarrow") is None:
+            raise BadArgument("Parquet exports need `pyarrow` installed.")
+        if vals["cog"] is not None and ctx.bot.get_cog(vals["cog"]) is None:
+            raise BadArgument(f"No cog named `{vals['cog']}` is loaded.")
+        if vals["dataset"] != "usage" and (vals["since"] or vals["until"]):
+            raise BadArgument("Date ranges only apply to the `usage` dataset.")
+        if vals["dataset"] in ("global", "automated") and vals["guild"] is not None:
+            raise BadArgument(f"The `{vals['dataset']}` dataset isn't split by guild.")
+        for key in ("since", "until"):
+            if vals[key] is not None:
+                vals[key] = parse_date(vals[key])
+        if vals["until"] is not None:
+            # include the whole final day
+            vals["until"] += datetime.timedelta(days=1)
+        if vals["since"] and vals["until"] and vals["since"] >= vals["until"]:
+            raise BadArgument("`--since` must be before `--until`.")
+        return vals
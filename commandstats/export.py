@@ -0,0 +1,114 @@
+import csv
+import datetime
+import itertools
+import json
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+DATASETS = ("global", "guild", "automated", "usage")
+FORMATS = ("csv", "jsonl", "parquet")
+COLUMNS = {
+    "global": ("command", "count"),
+    "automated": ("command", "count"),
+    "guild": ("guild", "command", "count"),
+    "usage": ("bucket", "resolution", "command", "guild", "count"),
+}
+# rows handed to the file writer at a time
+CHUNK = 5000
+
+
+def chunked(rows: Iterable[tuple], size: int = CHUNK) -> Iterator[List[tuple]]:
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def command_filter(
+    commands: Optional[Iterable[str]] = None, prefix: Optional[str] = None
+) -> Callable[[str], bool]:
+    """Predicate for the ``--cog`` and ``--prefix`` filters."""
+    commands = None if commands is None else set(commands)
+
+    def keep(command: str) -> bool:
+        if commands is not None and command not in commands:
+            return False
+        return prefix is None or command.startswith(prefix)
+
+    return keep
+
+
+def isoformat(bucket: int) -> str:
+    return datetime.datetime.fromtimestamp(bucket, tz=datetime.timezone.utc).isoformat()
+
+
+def write_rows(path: Path, fmt: str, columns: Sequence[str], rows: Iterable[tuple]) -> int:
+    """Write ``rows`` to ``path`` chunk by chunk, returning how many were written.
+
+    Blocking, run it in an executor.
+    """
+    written = 0
+    if fmt == "parquet":
+        # only needed for parquet exports, which the converter allows when it is installed
+        import pyarrow
+        import pyarrow.parquet
+
+        types = {
+            "command": pyarrow.string(),
+            "count": pyarrow.int64(),
+            "guild": pyarrow.int64(),
+            "bucket": pyarrow.string(),
+            "resolution": pyarrow.string(),
+        }
+        schema = pyarrow.schema([(column, types[column]) for column in columns])
+        with pyarrow.parquet.ParquetWriter(str(path), schema) as writer:
+            for chunk in chunked(rows):
+                writer.write_table(
+                    pyarrow.Table.from_arrays(
+                        [
+                            pyarrow.array(column, type=types[name])
+                            for name, column in zip(columns, zip(*chunk))
+                        ],
+                        schema=schema,
+                    )
+                )
+                written += len(chunk)
+        return written
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        if fmt == "csv":
+            writer = csv.writer(file)
+            writer.writerow(columns)
+            for chunk in chunked(rows):
+                writer.writerows(chunk)
+                written += len(chunk)
+        else:
+            for chunk in chunked(rows):
+                file.writelines(
+                    json.dumps(dict(zip(columns, row)), separators=(",", ":")) + "\n"
+                    for row in chunk
+                )
+                written += len(chunk)
+    return written
+
+
+def counter_rows(data, keep: Callable[[str], bool]) -> Iterator[Tuple[str, int]]:
+    for command, count in data.items():
+        if keep(command):
+            yield command, count
+
+
+def guild_rows(data, keep: Callable[[str], bool]) -> Iterator[Tuple[int, str, int]]:
+    for guild, counts in data.items():
+        for command, count in counts.items():
+            if keep(command):
+                yield int(guild), command, count
+
+
+def usage_rows(
+    rows: Iterable[Tuple[int, str, int, int]], resolution: str, keep: Callable[[str], bool]
+) -> Iterator[Tuple[str, str, str, int, int]]:
+    for bucket, command, guild, count in rows:
+        if keep(command):
+            yield isoformat(bucket), resolution, command, guild, count
@@ -0,0 +1,58 @@
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Iterator, List
+
+log = logging.getLogger("red.flare.commandstats")
+
+
+class DeltaJournal:
+    """Append-only file of usage deltas, one JSON object per line.
+
+    Every entry carries a sequence number. Compaction records the last sequence folded into
+    Config, so entries at or below it are skipped on replay even if truncating the file
+    afterwards never happened.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    async def append(self, entry: dict):
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        await asyncio.get_running_loop().run_in_executor(None, self._append, line)
+
+    def _append(self, line: str):
+        with open(self.path, "a", encoding="utf-8") as journal:
+            journal.write(line)
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    async def replay(self, after: int) -> List[dict]:
+        """Every entry with a sequence number above ``after``, in order."""
+        return await asyncio.get_running_loop().run_in_executor(None, list, self._read(after))
+
+    def _read(self, after: int) -> Iterator[dict]:
+        if not self.path.exists():
+            return
+        with open(self.path, encoding="utf-8") as journal:
+            for number, line in enumerate(journal, start=1):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # a torn write from a crash can only be the last line
+                    log.warning(f"Skipping unreadable journal line {number}.")
+                    continue
+                if not isinstance(entry, dict) or not isinstance(entry.get("seq"), int):
+                    log.warning(f"Skipping malformed journal line {number}.")
+                    continue
+                if entry["seq"] > after:
+                    yield entry
+
+    async def truncate(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._truncate)
+
+    def _truncate(self):
+        with open(self.path, "w", encoding="utf-8"):
+            pass
@@ -0,0 +1,53 @@
+import bisect
+import math
+from typing import Tuple
+
+# upper bounds in seconds, four buckets per doubling from 1ms up to roughly a minute
+BOUNDS: Tuple[float, ...] = tuple(0.001 * 2 ** (i / 4) for i in range(64))
+
+
+def humanize_seconds(seconds: float) -> str:
+    if seconds < 1:
+        return f"{seconds * 1000:.0f}ms"
+    return f"{seconds:.2f}s"
+
+
+class LatencyHistogram:
+    """Command timings counted into fixed, log scaled buckets.
+
+    Percentiles are reported as the upper bound of the bucket they fall in, which is at
+    most ~19% above the real value, so memory stays constant however many commands run.
+    """
+
+    __slots__ = ("counts", "count", "total", "maximum")
+
+    def __init__(self) -> None:
+        # the last bucket holds everything slower than the largest bound
+        self.counts = [0] * (len(BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, pct: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * pct / 100))
+        seen = 0
+        for index, amount in enumerate(self.counts):
+            seen += amount
+            if seen >= rank:
+                break
+        if index == len(BOUNDS):
+            return self.maximum
+        return min(BOUNDS[index], self.maximum)
@@ -145,6 +145,31 @@ class EmbedFormat(menus.ListPageSource):
         return embed
 
 
+class LatencySource(menus.ListPageSource):
+    def __init__(self, entries: Iterable[list]):
+        super().__init__(entries, per_page=1)
+
+    async def format_page(self, menu: GenericMenu, data) -> discord.Embed:
+        embed = discord.Embed(
+            title=menu.title,
+            colour=await menu.ctx.embed_color(),
+            description=box(
+                tabulate.tabulate(
+                    list(data), headers=["Command", "Uses", "p50", "p95", "p99", "Errors"]
+                ),
+                lang="prolog",
+            ),
+        )
+        embed.set_footer(
+            text="Slowest by p95 since {timestamp} | Page {page}/{amount}".format(
+                timestamp=menu.timestamp.strftime("%Y-%m-%d %H:%M UTC"),
+                page=menu.current_page + 1,
+                amount=menu._source.get_max_pages(),
+            )
+        )
+        return embed
+
+
 class LeaderboardSource(menus.ListPageSource):
     def __init__(self, entries):
         super().__init__(entries, per_page=10)
@@ -0,0 +1,99 @@
+import logging
+from typing import Iterator, Optional
+
+from aiohttp import web
+
+from .latency import BOUNDS
+
+log = logging.getLogger("red.flare.commandstats")
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+# every fourth histogram bound, i.e. powers of two from 1ms, keeps the exported series small
+EXPORTED_BOUNDS = tuple(range(0, len(BOUNDS), 4))
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render(cog) -> Iterator[str]:
+    """OpenMetrics exposition of the cog's in-memory counters."""
+    yield "# TYPE commandstats_session_commands counter\n"
+    yield "# HELP commandstats_session_commands Commands used since the cog was loaded.\n"
+    for command, amount in cog.session.items():
+        yield f'commandstats_session_commands_total{{command="{escape(command)}"}} {amount}\n'
+
+    if cog.totals is not None:
+        yield "# TYPE commandstats_commands counter\n"
+        yield "# HELP commandstats_commands Commands used since stats were first recorded.\n"
+        for command, amount in (cog.totals["global"] + cog.cache["session"]).items():
+            yield f'commandstats_commands_total{{command="{escape(command)}"}} {amount}\n'
+        yield "# TYPE commandstats_guild_commands counter\n"
+        yield "# HELP commandstats_guild_commands Commands used per guild.\n"
+        for guild, amount in cog.guild_sums.items():
+            yield f'commandstats_guild_commands_total{{guild="{guild}"}} {amount}\n'
+
+    yield "# TYPE commandstats_command_latency_seconds histogram\n"
+    yield "# HELP commandstats_command_latency_seconds Command latency since the cog was loaded.\n"
+    yield "# UNIT commandstats_command_latency_seconds seconds\n"
+    for command, histogram in cog.latency.items():
+        label = escape(command)
+        cumulative, counted = 0, 0
+        for index in EXPORTED_BOUNDS:
+            cumulative += sum(histogram.counts[counted : index + 1])
+            counted = index + 1
+            yield (
+                "commandstats_command_latency_seconds_bucket"
+                f'{{command="{label}",le="{BOUNDS[index]:g}"}} {cumulative}\n'
+            )
+        yield (
+            "commandstats_command_latency_seconds_bucket"
+            f'{{command="{label}",le="+Inf"}} {histogram.count}\n'
+        )
+        yield f'commandstats_command_latency_seconds_count{{command="{label}"}} {histogram.count}\n'
+        yield f'commandstats_command_latency_seconds_sum{{command="{label}"}} {histogram.total}\n'
+
+    yield "# TYPE commandstats_command_errors counter\n"
+    yield "# HELP commandstats_command_errors Failed invocations by exception type.\n"
+    for command, errors in cog.errors.items():
+        for error, amount in errors.items():
+            yield (
+                "commandstats_command_errors_total"
+                f'{{command="{escape(command)}",error="{escape(error)}"}} {amount}\n'
+            )
+    yield "# EOF\n"
+
+
+class MetricsServer:
+    """Serves ``/metrics`` for Prometheus from the cog's memory, Config is never touched."""
+
+    def __init__(self, cog) -> None:
+        self.cog = cog
+        self.runner: Optional[web.AppRunner] = None
+
+    @property
+    def running(self) -> bool:
+        return self.runner is not None
+
+    async def start(self, host: str, port: int):
+        await self.stop()
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, host, port).start()
+        except OSError:
+            await runner.cleanup()
+            raise
+        self.runner = runner
+        log.info(f"Serving command metrics on http://{host}:{port}/metrics")
+
+    async def stop(self):
+        if self.runner is not None:
+            runner, self.runner = self.runner, None
+            await runner.cleanup()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        body = "".join(render(self.cog)).encode()
+        return web.Response(body=body, headers={"Content-Type": CONTENT_TYPE})
@@ -0,0 +1,205 @@
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Counter, Dict, Iterator, List, Optional, Tuple
+
+HOUR = 3600
+DAY = 86400
+WEEK = 604800
+RESOLUTIONS = (HOUR, DAY, WEEK)
+# how long buckets of each resolution are kept before only the coarser ones remain
+RETENTION = {HOUR: 14 * DAY, DAY: 366 * DAY, WEEK: None}
+
+# rows fetched from SQLite at a time when exporting
+FETCH_SIZE = 5000
+
+# (hour bucket, command, guild id or 0)
+SeriesKey = Tuple[int, str, int]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    resolution INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    command TEXT NOT NULL,
+    guild INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (resolution, bucket, command, guild)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS usage_command ON usage (command, resolution, bucket);
+"""
+
+UPSERT = """
+INSERT INTO usage (resolution, bucket, command, guild, count) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (resolution, bucket, command, guild) DO UPDATE SET count = count + excluded.count
+"""
+
+
+def bucket_of(timestamp: float, resolution: int) -> int:
+    """Start of the bucket ``timestamp`` falls in. Weeks start on Monday."""
+    if resolution == WEEK:
+        # the unix epoch was a Thursday
+        return int((timestamp + 3 * DAY) // WEEK * WEEK - 3 * DAY)
+    return int(timestamp // resolution * resolution)
+
+
+def resolution_for(window: float) -> int:
+    """Finest resolution that still holds data ``window`` seconds back."""
+    for resolution in RESOLUTIONS:
+        retention = RETENTION[resolution]
+        if retention is None or window <= retention:
+            return resolution
+    return WEEK
+
+
+class UsageStore:
+    """Command usage bucketed by hour, day and week in a SQLite database.
+
+    Queries aggregate inside SQLite so history is never loaded into memory. All database
+    work runs on a single background thread.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="commandstats")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def close(self):
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+        self._executor.submit(_close)
+        self._executor.shutdown(wait=False)
+
+    async def add(self, series: Counter[SeriesKey]):
+        """Add hourly counts, rolling them up into the daily and weekly buckets."""
+        if series:
+            await self._run(self._add, dict(series))
+
+    def _add(self, series: Dict[SeriesKey, int]):
+        rows = [
+            (resolution, bucket_of(hour, resolution), command, guild, count)
+            for (hour, command, guild), count in series.items()
+            for resolution in RESOLUTIONS
+        ]
+        conn = self._connection()
+        with conn:
+            conn.executemany(UPSERT, rows)
+            now = time.time()
+            for resolution, retention in RETENTION.items():
+                if retention is not None:
+                    conn.execute(
+                        "DELETE FROM usage WHERE resolution = ? AND bucket < ?",
+                        (resolution, bucket_of(now - retention, resolution)),
+                    )
+
+    async def top(
+        self,
+        since: float,
+        *,
+        limit: Optional[int] = None,
+        guild: Optional[int] = None,
+        pending: Optional[Counter[SeriesKey]] = None,
+    ) -> List[Tuple[str, int]]:
+        """Most used commands since the ``since`` timestamp."""
+        resolution = resolution_for(time.time() - since)
+        start = bucket_of(since, resolution)
+        totals = Counter(dict(await self._run(self._top, resolution, start, guild)))
+        for (hour, command, guild_id), count in (pending or {}).items():
+            if hour >= start and (guild is None or guild_id == guild):
+                totals[command] += count
+        return totals.most_common(limit)
+
+    def _top(self, resolution: int, start: int, guild: Optional[int]):
+        query = "SELECT command, SUM(count) FROM usage WHERE resolution = ? AND bucket >= ?"
+        params = [resolution, start]
+        if guild is not None:
+            query += " AND guild = ?"
+            params.append(guild)
+        return self._connection().execute(query + " GROUP BY command", params).fetchall()
+
+    async def trend(
+        self,
+        command: str,
+        resolution: int,
+        points: int,
+        *,
+        pending: Optional[Counter[SeriesKey]] = None,
+    ) -> List[Tuple[int, int]]:
+        """Usage of ``command`` for the last ``points`` buckets, oldest first."""
+        current = bucket_of(time.time(), resolution)
+        buckets = [current]
+        for _ in range(points - 1):
+            buckets.append(bucket_of(buckets[-1] - 1, resolution))
+        buckets.reverse()
+        counts = Counter(dict(await self._run(self._trend, command, resolution, buckets[0])))
+        for (hour, name, _), count in (pending or {}).items():
+            if name == command:
+                counts[bucket_of(hour, resolution)] += count
+        return [(bucket, counts[bucket]) for bucket in buckets]
+
+    def _trend(self, command: str, resolution: int, start: int):
+        return (
+            self._connection()
+            .execute(
+                "SELECT bucket, SUM(count) FROM usage "
+                "WHERE command = ? AND resolution = ? AND bucket >= ? GROUP BY bucket",
+                (command, resolution, start),
+            )
+            .fetchall()
+        )
+
+    async def export(
+        self,
+        write: Callable[[Iterator[Tuple[int, str, int, int]]], int],
+        resolution: int,
+        *,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        guild: Optional[int] = None,
+    ) -> int:
+        """Stream ``(bucket, command, guild, count)`` rows into ``write`` on the database thread.
+
+        Rows are fetched in batches, so the result set is never held in memory at once.
+        """
+        return await self._run(self._export, write, resolution, since, until, guild)
+
+    def _export(self, write, resolution: int, since, until, guild):
+        query = "SELECT bucket, command, guild, count FROM usage WHERE resolution = ?"
+        params = [resolution]
+        if since is not None:
+            query += " AND bucket >= ?"
+            params.append(bucket_of(since, resolution))
+        if until is not None:
+            query += " AND bucket < ?"
+            params.append(until)
+        if guild is not None:
+            query += " AND guild = ?"
+            params.append(guild)
+        cursor = self._connection().execute(query + " ORDER BY bucket, command, guild", params)
+
+        def rows():
+            while True:
+                batch = cursor.fetchmany(FETCH_SIZE)
+                if not batch:
+                    return
+                yield from batch
+
+        try:
+            return write(rows())
+        finally:
+            cursor.close()
@@ -0,0 +1,249 @@
+"""Replayable throughput benchmark for ``Highlight.on_message``.
+
+Builds a synthetic highlight configuration, replays a message corpus through the listener
+using lightweight stand-ins for discord objects and reports throughput, latency
+percentiles and allocations.
+
+Run from the repository root::
+
+    python -m highlight.benchmark --users 10000 --words 10 --channels 500
+    python -m highlight.benchmark --corpus messages.txt --boundary 0.5
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import string
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from unittest import mock
+
+from redbot.core import Config
+
+from .highlight import Highlight
+
+ALLOWED = SimpleNamespace(read_messages=True)
+
+
+class FakeMember:
+    def __init__(self, user_id: int, bot: bool = False) -> None:
+        self.id = user_id
+        self.bot = bot
+        self.display_name = self.name = f"user{user_id}"
+        self.sent = 0
+
+    def __str__(self) -> str:
+        return f"{self.name}#0001"
+
+    async def send(self, content=None, *, embed=None):
+        self.sent += 1
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, members: Dict[int, FakeMember]) -> None:
+        self.id = guild_id
+        self.name = f"guild{guild_id}"
+        self.members = members
+
+    def get_member(self, user_id: int) -> Optional[FakeMember]:
+        return self.members.get(user_id)
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, guild: FakeGuild) -> None:
+        self.id = channel_id
+        self.guild = guild
+        self.mention = f"<#{channel_id}>"
+        self.history_calls = 0
+
+    def permissions_for(self, member):
+        return ALLOWED
+
+    async def history(self, *, limit, before, oldest_first=False):
+        self.history_calls += 1
+        return
+        yield
+
+
+class FakeMessage:
+    def __init__(self, message_id: int, content: str, author: FakeMember, channel: FakeChannel):
+        self.id = message_id
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.created_at = datetime.now(tz=timezone.utc)
+        self.jump_url = f"https://discord.com/channels/{self.guild.id}/{channel.id}/{message_id}"
+
+
+class FakeBot:
+    def __init__(self) -> None:
+        self.channels: Dict[int, FakeChannel] = {}
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        return self.channels.get(channel_id)
+
+    async def cog_disabled_in_guild(self, cog, guild) -> bool:
+        return False
+
+    async def allowed_by_whitelist_blacklist(self, who) -> bool:
+        return True
+
+
+def random_word(rng: random.Random, min_len: int = 5, max_len: int = 10) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(min_len, max_len)))
+
+
+def generate_config(args, rng: random.Random):
+    """Synthetic channel, guild and member caches in the shape Config returns them."""
+    vocabulary = [random_word(rng) for _ in range(args.vocabulary)]
+    channels = [1000 + i for i in range(args.channels)]
+    highlightcache, guildcache = {}, {}
+    for user_id in range(1, args.users + 1):
+        if rng.random() < args.guild_fraction:
+            scope = guildcache.setdefault(args.guild_id, {"highlight": {}})
+        else:
+            scope = highlightcache.setdefault(rng.choice(channels), {"highlight": {}})
+        scope["highlight"][str(user_id)] = {
+            word: {"toggle": True, "bots": False, "boundary": rng.random() < args.boundary}
+            for word in rng.sample(vocabulary, args.words)
+        }
+    member_cache = {args.guild_id: {}}
+    return vocabulary, channels, highlightcache, guildcache, member_cache
+
+
+def generate_corpus(args, rng: random.Random, vocabulary: List[str]) -> List[str]:
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as corpus:
+            return [line.rstrip("\n") for line in corpus if line.strip()]
+    corpus = []
+    for _ in range(args.messages):
+        words = []
+        while sum(map(len, words)) + len(words) < args.length:
+            if rng.random() < args.hit_rate:
+                words.append(rng.choice(vocabulary))
+            else:
+                words.append(random_word(rng, 2, 8))
+        corpus.append(" ".join(words))
+    return corpus
+
+
+def build_cog(args, rng: random.Random):
+    bot = FakeBot()
+    with mock.patch.object(Config, "get_conf"):
+        cog = Highlight(bot)
+    vocabulary, channels, highlightcache, guildcache, member_cache = generate_config(args, rng)
+    cog.highlightcache = highlightcache
+    cog.guildcache = guildcache
+    cog.member_cache = member_cache
+    cog.global_conf = {
+        "restricted": False,
+        "colour": 0xFF0000,
+        "default_cooldown": args.cooldown,
+        "dm_block_duration": 3600,
+    }
+    cog.cooldown = args.cooldown
+    members = {user_id: FakeMember(user_id) for user_id in range(1, args.users + args.authors + 1)}
+    guild = FakeGuild(args.guild_id, members)
+    for channel_id in channels:
+        bot.channels[channel_id] = FakeChannel(channel_id, guild)
+    authors = [members[args.users + i] for i in range(1, args.authors + 1)]
+    return cog, bot, guild, vocabulary, authors
+
+
+async def replay(cog, messages: List[FakeMessage], *, measure: bool = True) -> List[float]:
+    latencies = []
+    for message in messages:
+        start = time.perf_counter()
+        await cog.on_message(message)
+        if measure:
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def percentile(data: List[float], pct: float) -> float:
+    ordered = sorted(data)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    cog, bot, guild, vocabulary, authors = build_cog(args, rng)
+    corpus = generate_corpus(args, rng, vocabulary)
+    channels = list(bot.channels.values())
+    messages = [
+        FakeMessage(i, content, rng.choice(authors), rng.choice(channels))
+        for i, content in enumerate(corpus, start=1)
+    ]
+    cog.notifications.start()
+    try:
+        print(
+            f"{args.users} users x {args.words} words across {args.channels} channels, "
+            f"{len(messages)} messages of ~{args.length} characters"
+        )
+        start = time.perf_counter()
+        await replay(cog, messages[: args.warmup], measure=False)
+        print(
+            f"warmup ({args.warmup} messages, builds matchers): {time.perf_counter() - start:.3f}s"
+        )
+
+        start = time.perf_counter()
+        latencies = await replay(cog, messages)
+        elapsed = time.perf_counter() - start
+        print(f"throughput: {len(messages) / elapsed:,.0f} messages/sec")
+        print(
+            f"latency: mean {statistics.mean(latencies) * 1e6:,.1f}us  "
+            f"p50 {percentile(latencies, 50) * 1e6:,.1f}us  "
+            f"p99 {percentile(latencies, 99) * 1e6:,.1f}us  "
+            f"max {max(latencies) * 1e6:,.1f}us"
+        )
+
+        if args.alloc:
+            sample = messages[: args.alloc]
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+            await replay(cog, sample, measure=False)
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+            print(
+                f"allocations: {allocated / len(sample):,.0f} bytes retained/message, "
+                f"peak {peak / 1024:,.1f} KiB over {len(sample)} messages"
+            )
+
+        await cog.notifications.join()
+        print(
+            f"DMs sent: {sum(member.sent for member in guild.members.values())}, "
+            f"history fetches: {sum(channel.history_calls for channel in channels)}"
+        )
+    finally:
+        cog.notifications.stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--words", type=int, default=10, help="highlights per user")
+    parser.add_argument("--channels", type=int, default=500)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--guild-fraction", type=float, default=0.1)
+    parser.add_argument("--boundary", type=float, default=0.3)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--length", type=int, default=120, help="synthetic message length")
+    parser.add_argument("--hit-rate", type=float, default=0.02)
+    parser.add_argument("--authors", type=int, default=200)
+    parser.add_argument("--cooldown", type=int, default=60)
+    parser.add_argument("--warmup", type=int, default=1000)
+    parser.add_argument("--alloc", type=int, default=1000, help="messages traced, 0 to skip")
+    parser.add_argument("--corpus", help="file with one message per line to replay")
+    parser.add_argument("--guild-id", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,44 @@
+from collections import deque
+from typing import Iterable, List, NamedTuple
+
+import discord
+
+CONTEXT_SIZE = 6  # the highlighted message and the 5 messages before it
+
+
+class CachedMessage(NamedTuple):
+    id: int
+    author: str
+    content: str
+
+    @classmethod
+    def from_message(cls, message: discord.Message) -> "CachedMessage":
+        return cls(message.id, str(message.author), message.content)
+
+
+class ContextBuffer(deque):
+    """Ring buffer of the most recent messages sent in a channel.
+
+    The buffer is cold until it has either seen enough messages to fill itself or been
+    seeded from the channel history once.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(maxlen=CONTEXT_SIZE)
+        self.seeded = False
+
+    @property
+    def warm(self) -> bool:
+        return self.seeded or len(self) == self.maxlen
+
+    def seed(self, history: Iterable[CachedMessage]):
+        """Merge messages fetched from the API with those already buffered."""
+        merged = {entry.id: entry for entry in history}
+        merged.update((entry.id, entry) for entry in self)
+        self.clear()
+        self.extend(merged[message_id] for message_id in sorted(merged))
+        self.seeded = True
+
+    def context(self, message_id: int) -> List[CachedMessage]:
+        """Return the buffered messages up to and including ``message_id``."""
+        return [entry for entry in self if entry.id <= message_id]
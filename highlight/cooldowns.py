@@ -0,0 +1,57 @@
+import heapq
+import time
+from typing import Dict, List, Tuple
+
+CooldownKey = Tuple[int, int]  # (guild_id, user_id)
+
+
+class CooldownStore:
+    """Highlight cooldowns keyed by guild and user, using monotonic time.
+
+    Expiries are also pushed onto a min-heap so expired entries can be swept from the front
+    without scanning every user, keeping memory proportional to active cooldowns.
+    """
+
+    __slots__ = ("_expiries", "_heap")
+
+    def __init__(self) -> None:
+        self._expiries: Dict[CooldownKey, float] = {}
+        self._heap: List[Tuple[float, CooldownKey]] = []
+
+    def __len__(self) -> int:
+        return len(self._expiries)
+
+    def __contains__(self, key: CooldownKey) -> bool:
+        expiry = self._expiries.get(key)
+        return expiry is not None and expiry > time.monotonic()
+
+    def remaining(self, key: CooldownKey) -> float:
+        """Seconds until the cooldown of ``key`` ends, 0 if it isn't running."""
+        expiry = self._expiries.get(key)
+        if expiry is None:
+            return 0
+        return max(expiry - time.monotonic(), 0)
+
+    def start(self, key: CooldownKey, seconds: float):
+        now = time.monotonic()
+        self.sweep(now)
+        if seconds <= 0:
+            return
+        expiry = now + seconds
+        self._expiries[key] = expiry
+        heapq.heappush(self._heap, (expiry, key))
+
+    def sweep(self, now: float = None):
+        """Forget every cooldown that has expired."""
+        if now is None:
+            now = time.monotonic()
+        heap, expiries = self._heap, self._expiries
+        while heap and heap[0][0] <= now:
+            expiry, key = heapq.heappop(heap)
+            # the key may have been restarted since this entry was pushed
+            if expiries.get(key) == expiry:
+                del expiries[key]
+
+    def clear(self):
+        self._expiries.clear()
+        self._heap.clear()
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+import discord
+
+logger = logging.getLogger("red.flare.highlight")
+
+MAX_ATTEMPTS = 5
+MAX_BACKOFF = 60
+
+
+class Notification:
+    """Every pending highlight hit for a single user, delivered as one DM."""
+
+    __slots__ = ("user", "lines", "embed", "attempts")
+
+    def __init__(self, user: discord.Member, line: str, embed: discord.Embed) -> None:
+        self.user = user
+        self.lines: List[str] = [line]
+        self.embed = embed
+        self.attempts = 0
+
+    def merge(self, line: str, embed: discord.Embed):
+        self.lines.append(line)
+        self.embed = embed
+
+    @property
+    def content(self) -> str:
+        content = "\n".join(self.lines)
+        if len(content) <= 2000:
+            return content
+        shown, length = [], 0
+        for line in self.lines:
+            length += len(line) + 1
+            if length > 1950:
+                break
+            shown.append(line)
+        return "\n".join(shown) + f"\n...and {len(self.lines) - len(shown)} more highlights."
+
+
+class NotificationQueue:
+    """Deliver highlight DMs from a bounded pool of workers.
+
+    Hits for a user who already has a DM waiting are merged into it. A DM can be held back
+    for a delay, such as the rest of a cooldown, collecting every hit until it is queued.
+    Users with closed DMs are skipped for ``block_duration`` seconds and rate limits are
+    backed off from.
+    """
+
+    def __init__(self, workers: int = 4, block_duration: int = 3600) -> None:
+        self.workers = workers
+        self.block_duration = block_duration
+        self.pending: Dict[int, Notification] = {}
+        self.blocked: Dict[int, float] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers = {}
+
+    async def join(self):
+        """Wait until every queued notification has been handled."""
+        await self._queue.join()
+
+    def is_blocked(self, user_id: int) -> bool:
+        expiry = self.blocked.get(user_id)
+        if expiry is None:
+            return False
+        if expiry > time.monotonic():
+            return True
+        del self.blocked[user_id]
+        return False
+
+    def enqueue(self, user: discord.Member, line: str, embed: discord.Embed, delay: float = 0):
+        """Queue a hit for ``user``, holding a new DM back for ``delay`` seconds."""
+        notification = self.pending.get(user.id)
+        if notification is not None:
+            notification.merge(line, embed)
+            return
+        self.pending[user.id] = Notification(user, line, embed)
+        if delay > 0:
+            self._timers[user.id] = asyncio.get_running_loop().call_later(
+                delay, self._release, user.id
+            )
+        else:
+            self._queue.put_nowait(user.id)
+
+    def _release(self, user_id: int):
+        self._timers.pop(user_id, None)
+        if user_id in self.pending:
+            self._queue.put_nowait(user_id)
+
+    async def _worker(self):
+        while True:
+            user_id = await self._queue.get()
+            try:
+                notification = self.pending.pop(user_id, None)
+                if notification is not None:
+                    await self._deliver(notification)
+            except Exception as exc:
+                logger.error("Exception delivering highlight: ", exc_info=exc)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, notification: Notification):
+        user = notification.user
+        try:
+            await user.send(notification.content, embed=notification.embed)
+        except discord.Forbidden:
+            logger.debug(f"{user}({user.id}) has DMs closed, skipping their highlights.")
+            self.blocked[user.id] = time.monotonic() + self.block_duration
+        except discord.HTTPException as exc:
+            if exc.status != 429 or notification.attempts >= MAX_ATTEMPTS:
+                raise
+            notification.attempts += 1
+            retry_after = float(exc.response.headers.get("Retry-After", 0) or 0)
+            await asyncio.sleep(min(max(retry_after, 2**notification.attempts), MAX_BACKOFF))
+            self._requeue(notification)
+
+    def _requeue(self, notification: Notification):
+        queued = self.pending.get(notification.user.id)
+        if queued is not None:
+            notification.lines.extend(queued.lines)
+            notification.embed = queued.embed
+            self.pending[notification.user.id] = notification
+            return
+        self.pending[notification.user.id] = notification
+        self._queue.put_nowait(notification.user.id)
@@ -1,12 +1,10 @@
 import asyncio
 import logging
-import re
-from collections import defaultdict
-from datetime import datetime, timezone
 from io import BytesIO
-from typing import Literal, Optional
+from typing import Dict, FrozenSet, Literal, NamedTuple, Optional
 
 import discord
+import regex
 import tabulate
 from redbot.core import Config, commands
 from redbot.core.utils.chat_formatting import box, humanize_list, inline
@@ -14,8 +12,15 @@ from redbot.core.utils.menus import DEFAULT_CONTROLS, menu
 from redbot.core.utils.mod import is_mod_or_superior
 from redbot.core.utils.predicates import MessagePredicate
 
+from .context import CONTEXT_SIZE, CachedMessage, ContextBuffer
+from .cooldowns import CooldownStore
+from .dispatch import NotificationQueue
+from .matcher import REGEX_TIMEOUT, HighlightMatcher, PatternCache
+
 logger = logging.getLogger("red.flare.highlight")
 
+MAX_PATTERN_LENGTH = 100
+
 
 def chunks(l, n):
     """Yield successive n-sized chunks from l."""
@@ -23,6 +28,13 @@ def chunks(l, n):
         yield l[i : i + n]
 
 
+class Subscriber(NamedTuple):
+    member: discord.Member
+    whitelist: FrozenSet[int]
+    blacklist: FrozenSet[int]
+    cooldown: int
+
+
 async def restrictedhighlight_check(ctx):
     cog = ctx.bot.get_cog("Highlight")
     if cog is None:
@@ -44,6 +56,7 @@ class Highlight(commands.Cog):
             default_cooldown=60,
             colour=discord.Color.red().value,
             restricted=False,
+            dm_block_duration=3600,
         )
         self.config.register_member(blacklist=[], whitelist=[], cooldown=60, channel_blacklist=[])
         default_channel = {"highlight": {}}
@@ -51,11 +64,16 @@ class Highlight(commands.Cog):
         self.config.register_guild(**default_channel)
         self.highlightcache = {}
         self.member_cache = {}
-        self.cooldowns = {}
-        self.recache = {}
+        self.cooldowns = CooldownStore()
+        self.matchers = {}
+        self.recache = PatternCache()
+        self.context_buffers = {}
+        self.subscribers = {}
+        self.subscriber_generation = 0
         self.guildcache = {}
         self.global_conf = {}
         self.cooldown = 60
+        self.notifications = NotificationQueue()
 
     async def red_get_data_for_user(self, *, user_id: int):
         config = await self.config.all_channels()
@@ -80,9 +98,9 @@ class Highlight(commands.Cog):
         for channel in data:
             async with self.config.channel_from_id(channel).highlight() as highlight:
                 del highlight[str(user_id)]
-        await self.generate_cache()
+            await self.update_channel_cache(channel)
 
-    __version__ = "1.9.1"
+    __version__ = "1.10.0"
     __author__ = "flare#0001"
 
     def format_help_for_context(self, ctx: commands.Context):
@@ -93,13 +111,79 @@ class Highlight(commands.Cog):
     async def initalize(self):
         await self.migrate_config()
         await self.generate_cache()
+        self.notifications.start()
+
+    def cog_unload(self):
+        self.notifications.stop()
 
     async def generate_cache(self):
-        self.cooldown = await self.config.default_cooldown()
-        self.global_conf = await self.config.all()
+        await self.update_global_cache()
         self.highlightcache = await self.config.all_channels()
         self.member_cache = await self.config.all_members()
         self.guildcache = await self.config.all_guilds()
+        self.matchers = {}
+        self.context_buffers = {}
+        self.invalidate_subscribers()
+
+    async def update_global_cache(self):
+        old_conf = self.global_conf
+        self.global_conf = await self.config.all()
+        if any(
+            old_conf.get(key) != self.global_conf[key]
+            for key in ("restricted", "default_cooldown")
+        ):
+            self.invalidate_subscribers()
+        self.cooldown = self.global_conf["default_cooldown"]
+        self.notifications.block_duration = self.global_conf["dm_block_duration"]
+
+    async def update_channel_cache(self, channel_id: int):
+        """Reload a single channel's highlights and drop anything derived from them."""
+        data = await self.config.channel_from_id(channel_id).all()
+        if data["highlight"]:
+            self.highlightcache[channel_id] = data
+        else:
+            self.highlightcache.pop(channel_id, None)
+        channel = self.bot.get_channel(channel_id)
+        if channel is not None:
+            self.invalidate_indexes(channel.guild.id, channel_id)
+        else:
+            for guild_id in list(self.matchers):
+                self.invalidate_indexes(guild_id, channel_id)
+
+    async def update_guild_cache(self, guild_id: int):
+        """Reload a single guild's highlights and drop anything derived from them."""
+        data = await self.config.guild_from_id(guild_id).all()
+        if data["highlight"]:
+            self.guildcache[guild_id] = data
+        else:
+            self.guildcache.pop(guild_id, None)
+        self.invalidate_indexes(guild_id)
+
+    async def update_member_cache(self, member: discord.Member):
+        """Reload a single member's settings."""
+        data = await self.config.member(member).all()
+        self.member_cache.setdefault(member.guild.id, {})[member.id] = data
+        self.invalidate_subscribers(member.guild.id)
+
+    def invalidate_indexes(self, guild_id: int, channel_id: Optional[int] = None):
+        """Drop everything derived from highlights so it is rebuilt on the next message.
+
+        Not passing a channel drops everything held for the guild."""
+        for index in (self.matchers, self.context_buffers):
+            drop_scope(index, guild_id, channel_id)
+        self.invalidate_subscribers(guild_id, channel_id)
+
+    def invalidate_subscribers(
+        self, guild_id: Optional[int] = None, channel_id: Optional[int] = None
+    ):
+        """Drop eligible subscriber indexes after permissions or member settings change.
+
+        Not passing a guild drops the indexes of every guild."""
+        self.subscriber_generation += 1
+        if guild_id is None:
+            self.subscribers = {}
+        else:
+            drop_scope(self.subscribers, guild_id, channel_id)
 
     async def migrate_config(self):
         if await self.config.migrated():
@@ -127,102 +211,179 @@ class Highlight(commands.Cog):
         await self.config.migrated.set(True)
         logger.info("Migration complete.")
 
+    def get_matcher(self, channel: discord.TextChannel) -> HighlightMatcher:
+        guild_matchers = self.matchers.setdefault(channel.guild.id, {})
+        matcher = guild_matchers.get(channel.id)
+        if matcher is None:
+            highlights = {}
+            for data in (
+                self.highlightcache.get(channel.id, {}),
+                self.guildcache.get(channel.guild.id, {}),
+            ):
+                for user, words in data.get("highlight", {}).items():
+                    highlights.setdefault(user, {}).update(words)
+            matcher = HighlightMatcher(channel.guild.id, highlights, self.recache)
+            guild_matchers[channel.id] = matcher
+        return matcher
+
+    def get_context_buffer(self, channel: discord.TextChannel) -> ContextBuffer:
+        guild_buffers = self.context_buffers.setdefault(channel.guild.id, {})
+        buffer = guild_buffers.get(channel.id)
+        if buffer is None:
+            buffer = guild_buffers[channel.id] = ContextBuffer()
+        return buffer
+
+    async def fetch_context(self, message: discord.Message, buffer: ContextBuffer):
+        """Seed a cold buffer from the channel history and return the context of ``message``."""
+        history = [
+            CachedMessage.from_message(msg)
+            async for msg in message.channel.history(
+                limit=CONTEXT_SIZE - 1, before=message, oldest_first=False
+            )
+        ]
+        history.reverse()
+        buffer.seed(history)
+        return history + [CachedMessage.from_message(message)]
+
+    async def get_subscribers(
+        self, channel: discord.TextChannel, matcher: HighlightMatcher
+    ) -> Dict[int, Subscriber]:
+        """Users of ``matcher`` who may currently be notified of messages in ``channel``."""
+        guild_subscribers = self.subscribers.setdefault(channel.guild.id, {})
+        subscribers = guild_subscribers.get(channel.id)
+        if subscribers is not None:
+            return subscribers
+        generation = self.subscriber_generation
+        subscribers = {}
+        for user in matcher.users:
+            member = channel.guild.get_member(user)
+            if member is None or not await self.member_allowed(member):
+                continue
+            subscriber = self.make_subscriber(channel, member)
+            if subscriber is not None:
+                subscribers[user] = subscriber
+        # settings or permissions may have changed while this was being built
+        if generation == self.subscriber_generation:
+            guild_subscribers[channel.id] = subscribers
+        return subscribers
+
+    async def member_allowed(self, member: discord.Member) -> bool:
+        """Whether ``member`` may use highlights at all, regardless of the channel."""
+        if self.global_conf.get("restricted") and not await is_mod_or_superior(self.bot, member):
+            return False
+        return await self.bot.allowed_by_whitelist_blacklist(member)
+
+    def make_subscriber(
+        self, channel: discord.TextChannel, member: discord.Member
+    ) -> Optional[Subscriber]:
+        """``member``'s subscription to ``channel``, if they can be notified of it."""
+        if not channel.permissions_for(member).read_messages:
+            return None
+        settings = self.member_cache.get(channel.guild.id, {}).get(member.id, {})
+        if channel.id in settings.get("channel_blacklist", ()):
+            return None
+        return Subscriber(
+            member,
+            frozenset(settings.get("whitelist", ())),
+            frozenset(settings.get("blacklist", ())),
+            max(settings.get("cooldown", self.cooldown), self.cooldown),
+        )
+
+    async def refresh_subscriber(self, member: discord.Member):
+        """Update ``member``'s entries in the guild's subscriber indexes in place."""
+        guild_subscribers = self.subscribers.get(member.guild.id)
+        if not guild_subscribers:
+            return
+        guild_matchers = self.matchers.get(member.guild.id, {})
+        channels = [
+            channel_id
+            for channel_id in guild_subscribers
+            if member.id in getattr(guild_matchers.get(channel_id), "users", ())
+        ]
+        if not channels:
+            return
+        # builds in progress may have read the old roles
+        self.subscriber_generation += 1
+        allowed = await self.member_allowed(member)
+        for channel_id in channels:
+            subscribers = guild_subscribers.get(channel_id)
+            channel = member.guild.get_channel(channel_id)
+            if subscribers is None or channel is None:
+                continue
+            subscriber = self.make_subscriber(channel, member) if allowed else None
+            if subscriber is None:
+                subscribers.pop(member.id, None)
+            else:
+                subscribers[member.id] = subscriber
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before, after: discord.abc.GuildChannel):
+        if isinstance(after, discord.CategoryChannel):
+            # synced channels inherit the category's overwrites
+            self.invalidate_subscribers(after.guild.id)
+        else:
+            self.invalidate_subscribers(after.guild.id, after.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        self.invalidate_indexes(channel.guild.id, channel.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        if before.permissions != after.permissions:
+            self.invalidate_subscribers(after.guild.id)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        if before.roles != after.roles:
+            await self.refresh_subscriber(after)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        matchers = self.matchers.get(member.guild.id, {}).values()
+        if any(member.id in matcher.users for matcher in matchers):
+            self.invalidate_subscribers(member.guild.id)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        subscribers = self.subscribers.get(member.guild.id, {}).values()
+        if any(member.id in channel_subscribers for channel_subscribers in subscribers):
+            self.invalidate_subscribers(member.guild.id)
+
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         if isinstance(message.channel, discord.abc.PrivateChannel):
             return
+        matcher = self.get_matcher(message.channel)
+        if not matcher:
+            return
+        buffer = self.get_context_buffer(message.channel)
+        buffer.append(CachedMessage.from_message(message))
+        hits = matcher.match(message.content, message.author.bot)
+        if not hits:
+            return
+        # snapshot before awaiting anything, newer messages may be appended meanwhile
+        msglist = buffer.context(message.id) if buffer.warm else None
         if await self.bot.cog_disabled_in_guild(self, message.guild):
             return
-        highlight, highlightguild = (
-            self.highlightcache.get(message.channel.id),
-            self.guildcache.get(message.guild.id),
-        )
-        # highlight_guild = self.guildcache.get(message.guild.id)
-        if highlight is None:
-            highlight = {}
-        if highlightguild is None:
-            highlightguild = {}
-        highlight_guild = highlightguild.get("highlight", {})
-        highlight = highlight.get("highlight", {})
-        highlighted_dict = defaultdict(dict)
-        for d in (highlight, highlight_guild):
-            for key, value in d.items():
-                for val in value:
-                    highlighted_dict[key][val] = value[val]
-        for user in highlighted_dict:
-            if int(user) == message.author.id:
+        guild = message.guild
+        subscribers = await self.get_subscribers(message.channel, matcher)
+        embed = None
+        for user, highlighted_words in hits.items():
+            subscriber = subscribers.get(user)
+            if subscriber is None or user == message.author.id:
                 continue
-            if self.global_conf.get("restricted") and not await is_mod_or_superior(
-                self.bot, message.guild.get_member(int(user))
-            ):
+            if self.notifications.is_blocked(user):
                 continue
-            if self.cooldowns.get(int(user)):
-                seconds = (
-                    datetime.now(tz=timezone.utc) - self.cooldowns[int(user)]
-                ).total_seconds()
-                cooldown = (
-                    self.member_cache.get(message.guild.id, {})
-                    .get(int(user), {})
-                    .get("cooldown", self.cooldown)
-                )
-                if cooldown < self.cooldown:
-                    cooldown = self.cooldown
-                if seconds < cooldown:
+            # the whitelist takes priority over the blacklist
+            if subscriber.whitelist:
+                if message.author.id not in subscriber.whitelist:
                     continue
-            if self.member_cache.get(message.guild.id, False) and self.member_cache[
-                message.guild.id
-            ].get(int(user), False):
-                if (
-                    self.member_cache[message.guild.id][int(user)]["whitelist"]
-                    and message.author.id
-                    not in self.member_cache[message.guild.id][int(user)]["whitelist"]
-                ):
-                    continue
-                elif (
-                    self.member_cache[message.guild.id][int(user)]["blacklist"]
-                    and message.author.id
-                    in self.member_cache[message.guild.id][int(user)]["blacklist"]
-                ):
-                    continue
-                elif (
-                    self.member_cache[message.guild.id][int(user)]["channel_blacklist"]
-                    and message.channel.id
-                    in self.member_cache[message.guild.id][int(user)]["channel_blacklist"]
-                ):
-                    continue
-            highlighted_words = []
-            for word in highlighted_dict[user]:
-                if not highlighted_dict[user][word]["toggle"]:
-                    continue
-                if word in highlighted_words:
-                    continue
-
-                highlighted_usr = message.guild.get_member(int(user))
-                if highlighted_usr is None:
-                    continue
-                if not await self.bot.allowed_by_whitelist_blacklist(highlighted_usr):
-                    continue
-                if not message.channel.permissions_for(highlighted_usr).read_messages:
-                    continue
-                if message.author.bot and not highlighted_dict[user][word]["bots"]:
-                    continue
-                if highlighted_dict[user][word].get("boundary", False):
-                    if word.lower() in self.recache:
-                        pattern = self.recache[word.lower()]
-                    else:
-                        pattern = re.compile(rf"\b{re.escape(word.lower())}\b", flags=re.I)
-                        self.recache[word.lower()] = pattern
-                    if set(pattern.findall(message.content.lower())):
-                        highlighted_words.append(word)
-                elif word.lower() in message.content.lower():
-                    highlighted_words.append(word)
-            if highlighted_words:
-                msglist = [message]
-                async for messages in message.channel.history(
-                    limit=5, before=message, oldest_first=False
-                ):
-                    msglist.append(messages)
-                msglist.reverse()
+            elif message.author.id in subscriber.blacklist:
+                continue
+            if embed is None:
+                if msglist is None:
+                    msglist = await self.fetch_context(message, buffer)
                 context = "\n".join(f"**{x.author}**: {x.content}" for x in msglist)
                 if len(context) > 2000:
                     context = "**Context omitted due to message size limits.\n**"
@@ -233,11 +394,36 @@ class Highlight(commands.Cog):
                     description="{}".format(context),
                 )
                 embed.add_field(name="Jump", value=f"[Click for context]({message.jump_url})")
-                await highlighted_usr.send(
-                    f"Your highlighted word{'s' if len(highlighted_words) > 1 else ''} {humanize_list(list(map(inline, highlighted_words)))} was mentioned in {message.channel.mention} in {message.guild.name} by {message.author.display_name}.\n",
-                    embed=embed,
-                )
-                self.cooldowns[highlighted_usr.id] = datetime.now(tz=timezone.utc)
+            key = (guild.id, user)
+            remaining = self.cooldowns.remaining(key)
+            held = user in self.notifications.pending
+            # hits during the cooldown are held and sent as one DM once it ends, hits
+            # landing while a DM is still waiting are merged into it
+            self.notifications.enqueue(
+                subscriber.member,
+                f"Your highlighted word{'s' if len(highlighted_words) > 1 else ''} {humanize_list(list(map(inline, highlighted_words)))} was mentioned in {message.channel.mention} in {message.guild.name} by {message.author.display_name}.",
+                embed,
+                delay=remaining,
+            )
+            if not remaining:
+                self.cooldowns.start(key, subscriber.cooldown)
+            elif not held:
+                # the held DM starts the next cooldown when it goes out
+                self.cooldowns.start(key, remaining + subscriber.cooldown)
+
+    def validate_pattern(self, pattern: str) -> Optional[str]:
+        """Return why ``pattern`` cannot be used as a highlight, if it can't."""
+        if len(pattern) > MAX_PATTERN_LENGTH:
+            return f"Patterns cannot be longer than {MAX_PATTERN_LENGTH} characters."
+        try:
+            compiled = self.recache.get(pattern)
+        except regex.error as exc:
+            return f"That pattern is not a valid regex: {exc}"
+        try:
+            if compiled.search("", timeout=REGEX_TIMEOUT) is not None:
+                return "That pattern matches every message."
+        except TimeoutError:
+            return "That pattern takes too long to run."
 
     def channel_check(self, ctx: commands.Context, channel: discord.TextChannel):
         return (
@@ -277,7 +463,7 @@ class Highlight(commands.Cog):
             else:
                 whitelist.append(user.id)
                 await ctx.send(f"{ctx.author.name} has added {user} to their highlight whitelist.")
-        await self.generate_cache()
+        await self.update_member_cache(ctx.author)
 
     @whitelist.command(name="list")
     async def whitelist_list(self, ctx: commands.Context):
@@ -325,7 +511,7 @@ class Highlight(commands.Cog):
             else:
                 blacklist.append(user.id)
                 await ctx.send(f"{ctx.author.name} has added {user} to their highlight blacklist.")
-        await self.generate_cache()
+        await self.update_member_cache(ctx.author)
 
     @blacklist.command(name="channel")
     async def channel_blacklist_addremove(
@@ -345,7 +531,7 @@ class Highlight(commands.Cog):
                 await ctx.send(
                     f"{ctx.author.name} has added {channel} to their highlight blacklist."
                 )
-        await self.generate_cache()
+        await self.update_member_cache(ctx.author)
 
     @highlight.command(name="cooldown")
     async def cooldown(self, ctx: commands.Context, seconds: int = None):
@@ -368,7 +554,7 @@ class Highlight(commands.Cog):
             return
         await self.config.member(ctx.author).cooldown.set(seconds)
         await ctx.send(f"Your highlight cooldown time has been set to {seconds} seconds.")
-        await self.generate_cache()
+        await self.update_member_cache(ctx.author)
 
     @highlight.command()
     async def add(
@@ -413,7 +599,7 @@ class Highlight(commands.Cog):
         if failed:
             msg += f"The word{'s' if len(failed) > 1 else ''} {humanize_list(list(map(inline, failed)))} {'are' if len(failed) > 1 else 'is'} already in your highlight list for {channel}."
         await ctx.send(msg)
-        await self.generate_cache()
+        await self.update_channel_cache(channel.id)
 
     @highlight.command()
     async def remove(
@@ -437,8 +623,9 @@ class Highlight(commands.Cog):
             passed = []
             failed = []
             for word in text:
-                if word.lower() in highlight[f"{ctx.author.id}"]:
-                    del highlight[f"{ctx.author.id}"][word.lower()]
+                key = highlight_key(highlight[f"{ctx.author.id}"], word)
+                if key in highlight[f"{ctx.author.id}"]:
+                    del highlight[f"{ctx.author.id}"][key]
                     passed.append(word)
                 else:
                     failed.append(word)
@@ -449,7 +636,7 @@ class Highlight(commands.Cog):
             a = "doesn't"
             msg += f"The word{'s' if len(failed) > 1 else ''} {humanize_list(list(map(inline, failed)))} {a if len(failed) > 1 else 'do not'} exist in your highlight list for {channel}."
         await ctx.send(msg)
-        await self.generate_cache()
+        await self.update_channel_cache(channel.id)
 
     @highlight.command()
     async def toggle(
@@ -481,13 +668,13 @@ class Highlight(commands.Cog):
                 await ctx.send("All your highlights have been enabled.")
             else:
                 await ctx.send("All your highlights have been disabled.")
-            await self.generate_cache()
+            await self.update_channel_cache(channel.id)
             return
-        word = word.lower()
         async with self.config.channel(channel).highlight() as highlight:
             highlights = highlight.get(str(ctx.author.id))
             if not highlights:
                 return await ctx.send("You do not have any highlights setup.")
+            word = highlight_key(highlights, word)
             if word not in highlight[str(ctx.author.id)]:
                 return await ctx.send(
                     f"You do not have a highlight for `{word}` setup in {channel}"
@@ -497,7 +684,7 @@ class Highlight(commands.Cog):
                 await ctx.send(f"The highlight `{word}` has been enabled in {channel}.")
             else:
                 await ctx.send(f"The highlight `{word}` has been disabled in {channel}.")
-        await self.generate_cache()
+        await self.update_channel_cache(channel.id)
 
     @highlight.command()
     async def bots(
@@ -542,16 +729,16 @@ class Highlight(commands.Cog):
                 else:
                     await ctx.send("Bots will no longer trigger on any of your highlights.")
 
-                await self.generate_cache()
+                await self.update_channel_cache(channel.id)
             else:
                 await ctx.send("Cancelling.")
             return
 
-        word = word.lower()
         async with self.config.channel(channel).highlight() as highlight:
             highlights = highlight.get(str(ctx.author.id))
             if not highlights:
                 return await ctx.send("You do not have any highlights setup.")
+            word = highlight_key(highlights, word)
             if word not in highlight[str(ctx.author.id)]:
                 return await ctx.send(
                     f"You do not have a highlight for `{word}` setup in {channel}"
@@ -566,7 +753,7 @@ class Highlight(commands.Cog):
                     f"The highlight `{word}` will no longer be trigged by bots in {channel}."
                 )
 
-        await self.generate_cache()
+        await self.update_channel_cache(channel.id)
 
     @highlight.command(name="list")
     async def _list(self, ctx: commands.Context, channel: Optional[discord.TextChannel] = None):
@@ -587,6 +774,7 @@ class Highlight(commands.Cog):
                     on_or_off(highlight[f"{ctx.author.id}"][word]["toggle"]),
                     yes_or_no(not highlight[f"{ctx.author.id}"][word]["bots"]),
                     on_or_off(highlight[f"{ctx.author.id}"][word].get("boundary", False)),
+                    highlight[f"{ctx.author.id}"][word].get("mode", "word").title(),
                 ]
                 for word in highlight[f"{ctx.author.id}"]
             ]
@@ -598,7 +786,7 @@ class Highlight(commands.Cog):
                     description=box(
                         tabulate.tabulate(
                             sorted(page, key=lambda x: x[1], reverse=True),
-                            headers=["Word", "Toggle", "Ignoring Bots", "Word Boundaries"],
+                            headers=["Word", "Toggle", "Ignoring Bots", "Word Boundaries", "Mode"],
                         ),
                         lang="prolog",
                     ),
@@ -654,16 +842,16 @@ class Highlight(commands.Cog):
                 else:
                     await ctx.send("None of your highlights will use word boundaries.")
 
-                await self.generate_cache()
+                await self.update_channel_cache(channel.id)
             else:
                 await ctx.send("Cancelling.")
             return
 
-        word = word.lower()
         async with self.config.channel(channel).highlight() as highlight:
             highlights = highlight.get(str(ctx.author.id))
             if not highlights:
                 return await ctx.send("You do not have any highlights setup.")
+            word = highlight_key(highlights, word)
             if word not in highlight[str(ctx.author.id)]:
                 return await ctx.send(
                     f"You do not have a highlight for `{word}` setup in {channel}"
@@ -678,7 +866,112 @@ class Highlight(commands.Cog):
                     f"The highlight `{word}` will no longer use word boundaries in {channel}."
                 )
 
-        await self.generate_cache()
+        await self.update_channel_cache(channel.id)
+
+    @highlight.command()
+    async def fuzzy(
+        self,
+        ctx: commands.Context,
+        state: bool,
+        channel: Optional[discord.TextChannel] = None,
+        *,
+        word: str = None,
+    ):
+        """Use typo tolerant matching for highlighting.
+
+        Fuzzy highlights match any word within one typo of the highlight.
+        Expects a valid bool. Not passing a word will enable/disable fuzzy matching for all
+        highlights.
+        """
+        channel = channel or ctx.channel
+        check = self.channel_check(ctx, channel)
+        if not check:
+            await ctx.send("Either you or the bot does not have permission for that channel.")
+            return
+        mode = "fuzzy" if state else "word"
+        if word is None:
+            msg = "enable" if state else "disable"
+            await ctx.send(
+                f"Are you sure you wish to {msg} fuzzy matching for all your highlights? Type yes to confirm otherwise type no."
+            )
+            try:
+                pred = MessagePredicate.yes_or_no(ctx, user=ctx.author)
+                await ctx.bot.wait_for("message", check=pred, timeout=20)
+            except asyncio.TimeoutError:
+                await ctx.send("Exiting operation.")
+                return
+
+            if pred.result:
+                async with self.config.channel(channel).highlight() as highlight:
+                    highlights = highlight.get(str(ctx.author.id))
+                    if not highlights:
+                        return await ctx.send("You do not have any highlights setup.")
+                    for word in highlights:
+                        if highlights[word].get("mode") != "regex":
+                            highlights[word]["mode"] = mode
+                if state:
+                    await ctx.send("All your highlights will now use fuzzy matching.")
+                else:
+                    await ctx.send("None of your highlights will use fuzzy matching.")
+
+                await self.update_channel_cache(channel.id)
+            else:
+                await ctx.send("Cancelling.")
+            return
+
+        async with self.config.channel(channel).highlight() as highlight:
+            highlights = highlight.get(str(ctx.author.id))
+            if not highlights:
+                return await ctx.send("You do not have any highlights setup.")
+            word = highlight_key(highlights, word)
+            if word not in highlight[str(ctx.author.id)]:
+                return await ctx.send(
+                    f"You do not have a highlight for `{word}` setup in {channel}"
+                )
+            if highlights[word].get("mode") == "regex":
+                return await ctx.send("Regex highlights cannot use fuzzy matching.")
+            highlights[word]["mode"] = mode
+            if state:
+                await ctx.send(f"The highlight `{word}` will now use fuzzy matching in {channel}.")
+            else:
+                await ctx.send(
+                    f"The highlight `{word}` will no longer use fuzzy matching in {channel}."
+                )
+
+        await self.update_channel_cache(channel.id)
+
+    @highlight.command(name="regex")
+    async def _regex(
+        self, ctx: commands.Context, channel: Optional[discord.TextChannel] = None, *, pattern: str
+    ):
+        """Add a regex to be highlighted on.
+
+        Patterns are case insensitive and must not match an empty message.
+        Can also provide an optional channel argument for the highlight to be applied to that
+        channel. Use `[p]highlight remove` with the pattern to remove it, wrapped in quotes if
+        it contains spaces.
+        """
+        channel = channel or ctx.channel
+        check = self.channel_check(ctx, channel)
+        if not check:
+            await ctx.send("Either you or the bot does not have permission for that channel.")
+            return
+        error = self.validate_pattern(pattern)
+        if error is not None:
+            return await ctx.send(error)
+        async with self.config.channel(channel).highlight() as highlight:
+            highlights = highlight.setdefault(str(ctx.author.id), {})
+            if len(highlights) >= int(await self.config.max_highlights()):
+                return await ctx.send("You have reached the maximum number of highlights.")
+            if pattern in highlights:
+                return await ctx.send(
+                    f"The pattern {inline(pattern)} is already in your highlight list for {channel}."
+                )
+            highlights[pattern] = regex_highlight(pattern)
+        await ctx.send(
+            f"The pattern {inline(pattern)} was added to {ctx.author}'s highlight list in {channel}."
+        )
+        await self.update_channel_cache(channel.id)
 
     @commands.guild_only()
     @highlight.group(autohelp=True)
@@ -723,7 +1016,7 @@ class Highlight(commands.Cog):
         if failed:
             msg += f"The word{'s' if len(failed) > 1 else ''} {humanize_list(list(map(inline, failed)))} {'are' if len(failed) > 1 else 'is'} already in your highlight list for {ctx.guild}."
         await ctx.send(msg)
-        await self.generate_cache()
+        await self.update_guild_cache(ctx.guild.id)
 
     @guild.command(name="remove")
     async def guild_remove(self, ctx: commands.Context, *text: str):
@@ -740,8 +1033,9 @@ class Highlight(commands.Cog):
             passed = []
             failed = []
             for word in text:
-                if word.lower() in highlight[f"{ctx.author.id}"]:
-                    del highlight[f"{ctx.author.id}"][word.lower()]
+                key = highlight_key(highlight[f"{ctx.author.id}"], word)
+                if key in highlight[f"{ctx.author.id}"]:
+                    del highlight[f"{ctx.author.id}"][key]
                     passed.append(word)
                 else:
                     failed.append(word)
@@ -752,7 +1046,7 @@ class Highlight(commands.Cog):
             a = "doesn't"
             msg += f"The word{'s' if len(failed) > 1 else ''} {humanize_list(list(map(inline, failed)))} {a if len(failed) > 1 else 'do not'} exist in your highlight list for {ctx.guild}."
         await ctx.send(msg)
-        await self.generate_cache()
+        await self.update_guild_cache(ctx.guild.id)
 
     @guild.command(name="toggle")
     async def guild_toggle(
@@ -778,13 +1072,13 @@ class Highlight(commands.Cog):
                 await ctx.send("All your highlights have been enabled.")
             else:
                 await ctx.send("All your highlights have been disabled.")
-            await self.generate_cache()
+            await self.update_guild_cache(ctx.guild.id)
             return
-        word = word.lower()
         async with self.config.guild(ctx.guild).highlight() as highlight:
             highlights = highlight.get(str(ctx.author.id))
             if not highlights:
                 return await ctx.send("You do not have any highlights setup.")
+            word = highlight_key(highlights, word)
             if word not in highlight[str(ctx.author.id)]:
                 return await ctx.send(
                     f"You do not have a highlight for `{word}` setup for {ctx.guild}"
@@ -794,7 +1088,7 @@ class Highlight(commands.Cog):
                 await ctx.send(f"The highlight `{word}` has been enabled for {ctx.guild}.")
             else:
                 await ctx.send(f"The highlight `{word}` has been disabled for {ctx.guild}.")
-        await self.generate_cache()
+        await self.update_guild_cache(ctx.guild.id)
 
     @guild.command(name="bots")
     async def guild_bots(
@@ -833,16 +1127,16 @@ class Highlight(commands.Cog):
                 else:
                     await ctx.send("Bots will no longer trigger on any of your highlights.")
 
-                await self.generate_cache()
+                await self.update_guild_cache(ctx.guild.id)
             else:
                 await ctx.send("Cancelling.")
             return
 
-        word = word.lower()
         async with self.config.guild(ctx.guild).highlight() as highlight:
             highlights = highlight.get(str(ctx.author.id))
             if not highlights:
                 return await ctx.send("You do not have any highlights setup.")
+            word = highlight_key(highlights, word)
             if word not in highlight[str(ctx.author.id)]:
                 return await ctx.send(
                     f"You do not have a highlight for `{word}` setup for {ctx.guild}"
@@ -857,7 +1151,7 @@ class Highlight(commands.Cog):
                     f"The highlight `{word}` will no longer be trigged by bots for {ctx.guild}."
                 )
 
-        await self.generate_cache()
+        await self.update_guild_cache(ctx.guild.id)
 
     @guild.command(name="list")
     async def _guild_list(self, ctx: commands.Context):
@@ -873,6 +1167,7 @@ class Highlight(commands.Cog):
                     on_or_off(highlight[f"{ctx.author.id}"][word]["toggle"]),
                     yes_or_no(not highlight[f"{ctx.author.id}"][word]["bots"]),
                     on_or_off(highlight[f"{ctx.author.id}"][word].get("boundary", False)),
+                    highlight[f"{ctx.author.id}"][word].get("mode", "word").title(),
                 ]
                 for word in highlight[f"{ctx.author.id}"]
             ]
@@ -884,7 +1179,7 @@ class Highlight(commands.Cog):
                     description=box(
                         tabulate.tabulate(
                             sorted(page, key=lambda x: x[1], reverse=True),
-                            headers=["Word", "Toggle", "Ignoring Bots", "Word Boundaries"],
+                            headers=["Word", "Toggle", "Ignoring Bots", "Word Boundaries", "Mode"],
                         ),
                         lang="prolog",
                     ),
@@ -936,16 +1231,16 @@ class Highlight(commands.Cog):
                 else:
                     await ctx.send("None of your highlights will use word boundaries.")
 
-                await self.generate_cache()
+                await self.update_guild_cache(ctx.guild.id)
             else:
                 await ctx.send("Cancelling.")
             return
 
-        word = word.lower()
         async with self.config.guild(ctx.guild).highlight() as highlight:
             highlights = highlight.get(str(ctx.author.id))
             if not highlights:
                 return await ctx.send("You do not have any highlights setup.")
+            word = highlight_key(highlights, word)
             if word not in highlight[str(ctx.author.id)]:
                 return await ctx.send(
                     f"You do not have a highlight for `{word}` setup for {ctx.guild}"
@@ -960,7 +1255,100 @@ class Highlight(commands.Cog):
                     f"The highlight `{word}` will no longer use word boundaries for {ctx.guild}."
                 )
 
-        await self.generate_cache()
+        await self.update_guild_cache(ctx.guild.id)
+
+    @guild.command(name="fuzzy")
+    async def guild_fuzzy(
+        self,
+        ctx: commands.Context,
+        state: bool,
+        *,
+        word: str = None,
+    ):
+        """Use typo tolerant matching for guild highlighting.
+
+        Fuzzy highlights match any word within one typo of the highlight.
+        Expects a valid bool. Not passing a word will enable/disable fuzzy matching for all
+        highlights.
+        """
+        mode = "fuzzy" if state else "word"
+        if word is None:
+            msg = "enable" if state else "disable"
+            await ctx.send(
+                f"Are you sure you wish to {msg} fuzzy matching for all your highlights? Type yes to confirm otherwise type no."
+            )
+            try:
+                pred = MessagePredicate.yes_or_no(ctx, user=ctx.author)
+                await ctx.bot.wait_for("message", check=pred, timeout=20)
+            except asyncio.TimeoutError:
+                await ctx.send("Exiting operation.")
+                return
+
+            if pred.result:
+                async with self.config.guild(ctx.guild).highlight() as highlight:
+                    highlights = highlight.get(str(ctx.author.id))
+                    if not highlights:
+                        return await ctx.send("You do not have any highlights setup.")
+                    for word in highlights:
+                        if highlights[word].get("mode") != "regex":
+                            highlights[word]["mode"] = mode
+                if state:
+                    await ctx.send("All your highlights will now use fuzzy matching.")
+                else:
+                    await ctx.send("None of your highlights will use fuzzy matching.")
+
+                await self.update_guild_cache(ctx.guild.id)
+            else:
+                await ctx.send("Cancelling.")
+            return
+
+        async with self.config.guild(ctx.guild).highlight() as highlight:
+            highlights = highlight.get(str(ctx.author.id))
+            if not highlights:
+                return await ctx.send("You do not have any highlights setup.")
+            word = highlight_key(highlights, word)
+            if word not in highlight[str(ctx.author.id)]:
+                return await ctx.send(
+                    f"You do not have a highlight for `{word}` setup for {ctx.guild}"
+                )
+            if highlights[word].get("mode") == "regex":
+                return await ctx.send("Regex highlights cannot use fuzzy matching.")
+            highlights[word]["mode"] = mode
+            if state:
+                await ctx.send(
+                    f"The highlight `{word}` will now use fuzzy matching for {ctx.guild}."
+                )
+            else:
+                await ctx.send(
+                    f"The highlight `{word}` will no longer use fuzzy matching for {ctx.guild}."
+                )
+
+        await self.update_guild_cache(ctx.guild.id)
+
+    @guild.command(name="regex")
+    async def guild_regex(self, ctx: commands.Context, *, pattern: str):
+        """Add a regex to be highlighted on for the guild.
+
+        Patterns are case insensitive and must not match an empty message.
+        Use `[p]highlight guild remove` with the pattern to remove it, wrapped in quotes if
+        it contains spaces.
+        """
+        error = self.validate_pattern(pattern)
+        if error is not None:
+            return await ctx.send(error)
+        async with self.config.guild(ctx.guild).highlight() as highlight:
+            highlights = highlight.setdefault(str(ctx.author.id), {})
+            if len(highlights) >= int(await self.config.max_highlights()):
+                return await ctx.send("You have reached the maximum number of highlights.")
+            if pattern in highlights:
+                return await ctx.send(
+                    f"The pattern {inline(pattern)} is already in your highlight list for {ctx.guild}."
+                )
+            highlights[pattern] = regex_highlight(pattern)
+        await ctx.send(
+            f"The pattern {inline(pattern)} was added to {ctx.author}'s highlight list for {ctx.guild}."
+        )
+        await self.update_guild_cache(ctx.guild.id)
 
     @commands.group()
     @commands.is_owner()
@@ -974,7 +1362,7 @@ class Highlight(commands.Cog):
             return await ctx.send("Max number must be greater than 0.")
         await self.config.max_highlights.set(max_num)
         await ctx.send(f"Max number of highlights set to {max_num}.")
-        await self.generate_cache()
+        await self.update_global_cache()
 
     @highlightset.command()
     async def minlen(self, ctx, min_len: int):
@@ -983,7 +1371,7 @@ class Highlight(commands.Cog):
             return await ctx.send("Minimum length cannot be less than 1.")
         await self.config.min_len.set(min_len)
         await ctx.send(f"Minimum length of highlight set to {min_len}.")
-        await self.generate_cache()
+        await self.update_global_cache()
 
     @highlightset.command(name="cooldown")
     async def _cooldown(self, ctx, cooldown: int):
@@ -994,7 +1382,18 @@ class Highlight(commands.Cog):
             return await ctx.send("Cooldown cannot be less than 1 or greater than 600.")
         await self.config.default_cooldown.set(cooldown)
         await ctx.send(f"Default cooldown set to {cooldown}.")
-        self.cooldown = cooldown
+        await self.update_global_cache()
+
+    @highlightset.command()
+    async def dmblock(self, ctx, seconds: int):
+        """Set how long to stop highlighting users who have their DMs closed. (in seconds)
+
+        Users who cannot be messaged are skipped for this long before being retried."""
+        if seconds < 0:
+            return await ctx.send("The duration cannot be negative.")
+        await self.config.dm_block_duration.set(seconds)
+        await ctx.send(f"Users with closed DMs will be skipped for {seconds} seconds.")
+        await self.update_global_cache()
 
     @highlightset.command(aliases=["color"])
     async def colour(self, ctx, *, colour: discord.Colour = None):
@@ -1006,7 +1405,7 @@ class Highlight(commands.Cog):
         else:
             await self.config.colour.set(colour.value)
             await ctx.send("The color has been set.")
-        await self.generate_cache()
+        await self.update_global_cache()
 
     @highlightset.command()
     async def restrict(self, ctx, toggle: bool):
@@ -1017,7 +1416,25 @@ class Highlight(commands.Cog):
             await ctx.send("Highlights can now only be used by users with mod/admin permissions.")
         else:
             await ctx.send("Highlights can now be used by all users.")
-        await self.generate_cache()
+        await self.update_global_cache()
+
+
+def regex_highlight(pattern: str) -> dict:
+    return {"toggle": True, "bots": False, "boundary": False, "mode": "regex", "pattern": pattern}
+
+
+def highlight_key(highlights: dict, word: str) -> str:
+    """The key ``word`` is stored under, regex highlights keep their case and words don't."""
+    return word if word in highlights else word.lower()
+
+
+def drop_scope(index: dict, guild_id: int, channel_id: Optional[int] = None):
+    if channel_id is None:
+        index.pop(guild_id, None)
+        return
+    guild_index = index.get(guild_id)
+    if guild_index is not None:
+        guild_index.pop(channel_id, None)
 
 
 def yes_or_no(boolean: bool):
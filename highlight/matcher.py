@@ -0,0 +1,272 @@
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import regex
+
+logger = logging.getLogger("red.flare.highlight")
+
+MODES = ("word", "fuzzy", "regex")
+REGEX_BUDGET = 0.05  # seconds after which no further regex is started for a message
+REGEX_TIMEOUT = 0.05  # seconds a single regex may spend on a message
+MAX_STRIKES = 3
+WORD_RE = regex.compile(r"\w+")
+
+Subscribers = List[Tuple[int, dict]]
+
+
+class PatternCache:
+    """Bounded LRU of compiled regex highlights, shared by every channel matcher."""
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        self._patterns: "OrderedDict[str, regex.Pattern]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def get(self, pattern: str) -> "regex.Pattern":
+        compiled = self._patterns.get(pattern)
+        if compiled is not None:
+            self._patterns.move_to_end(pattern)
+            return compiled
+        compiled = regex.compile(pattern, flags=regex.I)
+        self._patterns[pattern] = compiled
+        if len(self._patterns) > self.maxsize:
+            self._patterns.popitem(last=False)
+        return compiled
+
+
+def is_word_char(char: str) -> bool:
+    """Mirror of the regex ``\\w`` class for a single character."""
+    return char.isalnum() or char == "_"
+
+
+def bounded(content: str, start: int, end: int) -> bool:
+    """Whether ``content[start:end]`` would satisfy ``\\b...\\b``."""
+    before = start > 0 and is_word_char(content[start - 1])
+    after = end < len(content) and is_word_char(content[end])
+    return before != is_word_char(content[start]) and after != is_word_char(content[end - 1])
+
+
+def deletions(word: str) -> Iterator[str]:
+    """The word itself and every string one deletion away from it."""
+    yield word
+    for i in range(len(word)):
+        yield word[:i] + word[i + 1 :]
+
+
+def within_one_edit(first: str, second: str) -> bool:
+    """Whether the Levenshtein distance between two strings is at most 1."""
+    if first == second:
+        return True
+    if abs(len(first) - len(second)) > 1:
+        return False
+    if len(first) > len(second):
+        first, second = second, first
+    i = 0
+    while i < len(first) and first[i] == second[i]:
+        i += 1
+    if len(first) == len(second):
+        return first[i + 1 :] == second[i + 1 :]
+    return first[i:] == second[i + 1 :]
+
+
+class HighlightMatcher:
+    """Every highlight that applies to a channel, compiled for a single pass over a message.
+
+    Channel and guild highlights are merged when the matcher is built. Plain words share
+    one Aho-Corasick automaton, fuzzy words are looked up through a deletion index of the
+    message's tokens and regex highlights run under a per-message time budget.
+    """
+
+    __slots__ = (
+        "guild_id",
+        "words",
+        "subscribers",
+        "fuzzy_words",
+        "fuzzy_subscribers",
+        "patterns",
+        "users",
+        "_goto",
+        "_fail",
+        "_output",
+        "_fuzzy_index",
+        "_strikes",
+    )
+
+    def __init__(
+        self,
+        guild_id: int,
+        highlights: Dict[str, Dict[str, dict]],
+        pattern_cache: Optional[PatternCache] = None,
+    ) -> None:
+        self.guild_id = guild_id
+        pattern_cache = pattern_cache or PatternCache()
+        modes: Dict[str, Dict[str, Subscribers]] = {mode: {} for mode in MODES}
+        for user, user_highlights in highlights.items():
+            for word, settings in user_highlights.items():
+                if not settings.get("toggle", False):
+                    continue
+                mode = settings.get("mode", "word")
+                key = settings.get("pattern", word) if mode == "regex" else word.lower()
+                modes.get(mode, modes["word"]).setdefault(key, []).append((int(user), settings))
+
+        self.words = list(modes["word"])
+        self.subscribers = [modes["word"][word] for word in self.words]
+        self.fuzzy_words = list(modes["fuzzy"])
+        self.fuzzy_subscribers = [modes["fuzzy"][word] for word in self.fuzzy_words]
+        self.patterns: List[Tuple[str, "regex.Pattern", Subscribers]] = []
+        for pattern, subscribers in modes["regex"].items():
+            try:
+                self.patterns.append((pattern, pattern_cache.get(pattern), subscribers))
+            except regex.error:
+                logger.warning(f"Skipping invalid highlight pattern {pattern!r}.")
+        self.users = {
+            user
+            for mode in modes.values()
+            for subscribers in mode.values()
+            for user, _ in subscribers
+        }
+        self._strikes = [0] * len(self.patterns)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[int, ...]] = [()]
+        self._fuzzy_index: Dict[str, List[int]] = {}
+        self._build()
+
+    def __bool__(self) -> bool:
+        return bool(self.words or self.fuzzy_words or self.patterns)
+
+    def __repr__(self) -> str:
+        return (
+            f"<HighlightMatcher guild_id={self.guild_id} words={len(self.words)} "
+            f"fuzzy={len(self.fuzzy_words)} patterns={len(self.patterns)}>"
+        )
+
+    def _build(self):
+        goto, fail, output = self._goto, self._fail, self._output
+        for index, word in enumerate(self.words):
+            state = 0
+            for char in word:
+                nxt = goto[state].get(char)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][char] = nxt
+                    goto.append({})
+                    fail.append(0)
+                    output.append(())
+                state = nxt
+            output[state] += (index,)
+
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in goto[state].items():
+                queue.append(nxt)
+                link = fail[state]
+                while link and char not in goto[link]:
+                    link = fail[link]
+                fail[nxt] = goto[link].get(char, 0)
+                output[nxt] += output[fail[nxt]]
+
+        for index, word in enumerate(self.fuzzy_words):
+            for deletion in set(deletions(word)):
+                self._fuzzy_index.setdefault(deletion, []).append(index)
+
+    def scan(self, content: str) -> Dict[int, bool]:
+        """Scan already lowercased content.
+
+        Returns a mapping of word index to whether any occurrence of it sat on word
+        boundaries.
+        """
+        goto, fail, output, words = self._goto, self._fail, self._output, self.words
+        found: Dict[int, bool] = {}
+        state = 0
+        for pos, char in enumerate(content):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in output[state]:
+                if found.get(index):
+                    continue
+                end = pos + 1
+                found[index] = bounded(content, end - len(words[index]), end)
+        return found
+
+    def scan_fuzzy(self, content: str) -> List[int]:
+        """Fuzzy words within one edit of a token in already lowercased content."""
+        index = self._fuzzy_index
+        found: Dict[int, None] = {}
+        for token in set(WORD_RE.findall(content)):
+            for deletion in deletions(token):
+                for candidate in index.get(deletion, ()):
+                    if candidate not in found and within_one_edit(
+                        token, self.fuzzy_words[candidate]
+                    ):
+                        found[candidate] = None
+        return list(found)
+
+    def scan_patterns(self, content: str) -> List[int]:
+        """Regex highlights found in ``content``, stopping once the time budget is spent.
+
+        Every pattern that is started gets the full timeout, so a timeout is only counted
+        against the pattern that was slow on its own.
+        """
+        found = []
+        deadline = time.monotonic() + REGEX_BUDGET
+        for index, (pattern, compiled, _) in enumerate(self.patterns):
+            if self._strikes[index] >= MAX_STRIKES:
+                continue
+            if time.monotonic() >= deadline:
+                logger.debug(f"Highlight regex budget spent in guild {self.guild_id}.")
+                break
+            try:
+                if compiled.search(content, timeout=REGEX_TIMEOUT):
+                    found.append(index)
+            except TimeoutError:
+                self._strikes[index] += 1
+                logger.warning(
+                    f"Highlight pattern {pattern!r} in guild {self.guild_id} timed out "
+                    f"({self._strikes[index]}/{MAX_STRIKES})."
+                )
+                break
+        return found
+
+    @staticmethod
+    def _collect(
+        hits: Dict[int, List[str]],
+        word: str,
+        subscribers: Subscribers,
+        author_bot: bool,
+        on_boundary: bool = True,
+    ):
+        for user, settings in subscribers:
+            if author_bot and not settings.get("bots", False):
+                continue
+            if settings.get("boundary", False) and not on_boundary:
+                continue
+            hits.setdefault(user, []).append(word)
+
+    def match(self, content: str, author_bot: bool = False) -> Dict[int, List[str]]:
+        """Return every user whose highlights are present in ``content``."""
+        hits: Dict[int, List[str]] = {}
+        if not self:
+            return hits
+        lowered = content.lower()
+        if self.words:
+            for index, on_boundary in self.scan(lowered).items():
+                self._collect(
+                    hits, self.words[index], self.subscribers[index], author_bot, on_boundary
+                )
+        if self.fuzzy_words:
+            for index in self.scan_fuzzy(lowered):
+                self._collect(
+                    hits, self.fuzzy_words[index], self.fuzzy_subscribers[index], author_bot
+                )
+        if self.patterns:
+            for index in self.scan_patterns(content):
+                pattern, _, subscribers = self.patterns[index]
+                self._collect(hits, pattern, subscribers, author_bot)
+        return hits
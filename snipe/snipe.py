@@ -1,25 +1,29 @@
 import asyncio
 import logging
-from collections import defaultdict, deque
+import time
 from datetime import datetime, timedelta, timezone
-from typing import Literal, Optional
+from typing import List, Literal, Optional
 
 import discord
 from redbot.core import Config, commands
 from redbot.core.commands.converter import TimedeltaConverter
+from redbot.core.utils.chat_formatting import box, humanize_number
 from redbot.core.utils.menus import DEFAULT_CONTROLS
 
 from .menus import menu
+from .store import DEFAULT_MAX_BYTES, DEFAULT_MAX_ENTRIES, RecentMessages, Record, SnipeStore
 
 log = logging.getLogger("red.flare.snipe")
 
 CacheType = Literal["edit", "delete"]
 
+DEFAULTS_GUILD = {"toggle": False, "timeout": 30, "max": 1}
+
 
 class Snipe(commands.Cog):
     """Snipe the last message from a server."""
 
-    __version__ = "0.3.0"
+    __version__ = "0.4.0"
 
     def format_help_for_context(self, ctx):
         """Thanks Sinbad."""
@@ -27,13 +31,14 @@ class Snipe(commands.Cog):
         return f"{pre_processed}\nCog Version: {self.__version__}"
 
     def __init__(self, bot):
-        defaults_guild = {"toggle": False, "timeout": 30, "max": 1}
         self.config = Config.get_conf(self, identifier=95932766180343808, force_registration=True)
-        self.config.register_guild(**defaults_guild)
-        self.config.register_global(timer=60)
+        self.config.register_guild(**DEFAULTS_GUILD)
+        self.config.register_global(
+            timer=60, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES
+        )
         self.bot = bot
-        self.delete_cache = defaultdict(dict)
-        self.edit_cache = defaultdict(dict)
+        self.store = SnipeStore()
+        self.recent = RecentMessages()
         self.snipe_loop_task: Optional[asyncio.Task] = None
 
     async def red_get_data_for_user(self, *, user_id: int):
@@ -46,35 +51,19 @@ class Snipe(commands.Cog):
 
     async def init(self):
         self.snipe_loop_task = self.bot.loop.create_task(self.snipe_loop())
+        self.store.max_entries = await self.config.max_entries()
+        self.store.max_bytes = await self.config.max_bytes()
         await self.generate_cache()
 
     def cog_unload(self):
         if self.snipe_loop_task:
             self.snipe_loop_task.cancel()
 
-    def clear_cache(self, cache_type: CacheType):
-        cache = getattr(self, f"{cache_type}_cache")
-        for guild_id, channels in cache.items():
-            for _, queue in channels.items():
-                i = sum(
-                    (datetime.now(tz=timezone.utc) - message["timestamp"]).total_seconds()
-                    > self.config_cache[guild_id]["timeout"]
-                    for message in queue
-                )
-
-                if i > 0:
-                    for _ in range(i):
-                        try:
-                            queue.popleft()
-                        except IndexError:
-                            pass
-
     async def snipe_loop(self):
         await self.bot.wait_until_ready()
         while True:
             try:
-                self.clear_cache("delete")
-                self.clear_cache("edit")
+                self.store.expire()
                 await asyncio.sleep(await self.config.timer())
             except Exception as exc:
                 log.error("Exception occured in snipe loop: ", exc_info=exc)
@@ -83,41 +72,49 @@ class Snipe(commands.Cog):
     async def generate_cache(self):
         self.config_cache = await self.config.all_guilds()
 
+    def guild_settings(self, guild_id: int) -> dict:
+        return self.config_cache.get(guild_id, DEFAULTS_GUILD)
+
+    async def set_guild_setting(self, guild: discord.Guild, key: str, value):
+        """Save a guild setting and write it through to the cache."""
+        await self.config.guild(guild).set_raw(key, value=value)
+        self.config_cache.setdefault(guild.id, dict(DEFAULTS_GUILD))[key] = value
+
+    def add_cache_entries(
+        self, cache_type: CacheType, guild_id: int, channel_id: int, records: List[Record]
+    ):
+        config = self.guild_settings(guild_id)
+        self.store.add_many(
+            (cache_type, guild_id, channel_id),
+            records,
+            config.get("max", 1),
+            config.get("timeout", 30),
+        )
+
     def add_delete_cache_entry(self, message: discord.Message):
-        if self.delete_cache[message.guild.id].get(message.channel.id) is None:
-            self.delete_cache[message.guild.id][message.channel.id] = deque(
-                maxlen=self.config_cache[message.guild.id].get("max", 1)
-            )
-        self.delete_cache[message.guild.id][message.channel.id].append(
-            {
-                "content": message.content,
-                "author": message.author.id,
-                "timestamp": datetime.now(tz=timezone.utc),
-            }
+        self.recent.pop(message.id)
+        self.add_cache_entries(
+            "delete", message.guild.id, message.channel.id, [Record.from_message(message)]
         )
 
     def add_edit_cache_entry(self, before: discord.Message, after: discord.Message):
-        if self.edit_cache[after.guild.id].get(after.channel.id) is None:
-            self.edit_cache[after.guild.id][after.channel.id] = deque(
-                maxlen=self.config_cache[after.guild.id].get("max", 1)
-            )
-        self.edit_cache[after.guild.id][after.channel.id].append(
-            {
-                "old_content": before.content,
-                "new_content": after.content,
-                "author": after.author.id,
-                "timestamp": datetime.now(tz=timezone.utc),
-            }
-        )
+        record = Record(after.author.id, after.content, old_content=before.content)
+        self.add_cache_entries("edit", after.guild.id, after.channel.id, [record])
+
+    def _enabled(self, guild_id: Optional[int]) -> bool:
+        return self.guild_settings(guild_id)["toggle"]
 
     def _listener_should_return(self, message: discord.Message) -> bool:
         guild = message.guild
         if not guild or message.author.bot:
             return True
-        config = self.config_cache.get(guild.id)
-        if not config:
-            return True
-        return not config["toggle"]
+        return not self._enabled(guild.id)
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if self._listener_should_return(message):
+            return
+        self.recent.add(Record.from_message(message))
 
     @commands.Cog.listener()
     async def on_message_delete(self, message: discord.Message):
@@ -125,12 +122,46 @@ class Snipe(commands.Cog):
             return
         self.add_delete_cache_entry(message)
 
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        # cached messages are handled by on_message_delete
+        if payload.cached_message is not None or not self._enabled(payload.guild_id):
+            return
+        record = self.recent.pop(payload.message_id)
+        if record is None:
+            return
+        record.created = time.time()
+        self.add_cache_entries("delete", payload.guild_id, payload.channel_id, [record])
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        """Snipe purges in one batch, whether discord.py cached the messages or not."""
+        if not self._enabled(payload.guild_id):
+            return
+        cached = {message.id: message for message in payload.cached_messages}
+        now = time.time()
+        records = []
+        for message_id in sorted(payload.message_ids):
+            record = self.recent.pop(message_id)
+            message = cached.get(message_id)
+            if message is not None:
+                if message.author.bot:
+                    continue
+                record = Record.from_message(message, created=now)
+            elif record is None:
+                continue
+            record.created = now
+            records.append(record)
+        self.add_cache_entries("delete", payload.guild_id, payload.channel_id, records)
+
     @commands.Cog.listener()
     async def on_message_edit(self, before: discord.Message, after: discord.Message):
         if before.content == after.content:
             return
         if self._listener_should_return(after):
             return
+        if after.id in self.recent:
+            self.recent.add(Record.from_message(after))
         self.add_edit_cache_entry(before, after)
 
     @staticmethod
@@ -152,7 +183,6 @@ class Snipe(commands.Cog):
         channel: discord.TextChannel = None,
         amount: int = 1,
     ):
-        cache = getattr(self, f"{snipe_type}_cache")
         channel = channel or ctx.channel
         author_perms = channel.permissions_for(ctx.author)
         if not (author_perms.read_messages and author_perms.read_message_history):
@@ -160,7 +190,8 @@ class Snipe(commands.Cog):
             return False
 
         guild: discord.Guild = ctx.guild
-        if not await self.config.guild(guild).toggle():
+        settings = self.guild_settings(guild.id)
+        if not settings["toggle"]:
             await self.reply(
                 ctx,
                 f"Sniping is not allowed in this server! An admin may turn it on by typing `{ctx.clean_prefix}snipeset enable true`.",
@@ -168,15 +199,12 @@ class Snipe(commands.Cog):
             return False
         snipes = []
         for _ in range(amount):
-            try:
-                snipe = cache[guild.id][channel.id].pop()
-                if datetime.now(tz=timezone.utc) - snipe["timestamp"] > timedelta(
-                    seconds=await self.config.guild(guild).timeout()
-                ):
-                    continue
-                snipes.append(snipe)
-            except (IndexError, KeyError):
+            snipe = self.store.pop((snipe_type, guild.id, channel.id))
+            if snipe is None:
                 return snipes
+            if time.time() - snipe.created > settings["timeout"]:
+                continue
+            snipes.append(snipe)
         if not snipes:
             return
         return snipes
@@ -184,7 +212,7 @@ class Snipe(commands.Cog):
     @commands.guild_only()
     @commands.cooldown(rate=1, per=5, type=commands.BucketType.channel)
     @commands.bot_has_permissions(embed_links=True)
-    @commands.command()
+    @commands.group(invoke_without_command=True)
     async def snipe(
         self,
         ctx: commands.Context,
@@ -201,29 +229,72 @@ class Snipe(commands.Cog):
 
         if not ctx.guild.chunked:
             await ctx.guild.chunk()
+        await self.reply(ctx, embeds=self.delete_embeds(ctx, channelsnipes))
+
+    # the group's checks don't run for subcommands since it's invoked without one
+    @commands.guild_only()
+    @commands.cooldown(rate=1, per=5, type=commands.BucketType.channel)
+    @commands.bot_has_permissions(embed_links=True)
+    @snipe.command(name="user")
+    async def snipe_user(self, ctx: commands.Context, member: discord.Member, amount: int = 1):
+        """Shows the last deleted messages from a member in channels you can read."""
+        settings = self.guild_settings(ctx.guild.id)
+        if not settings["toggle"]:
+            await self.reply(
+                ctx,
+                f"Sniping is not allowed in this server! An admin may turn it on by typing `{ctx.clean_prefix}snipeset enable true`.",
+            )
+            return
+        now = time.time()
+
+        def check(record: Record) -> bool:
+            if now - record.created > settings["timeout"]:
+                return False
+            channel = ctx.guild.get_channel(record.channel[2])
+            if channel is None:
+                return False
+            perms = channel.permissions_for(ctx.author)
+            return perms.read_messages and perms.read_message_history
+
+        snipes = self.store.pop_author("delete", ctx.guild.id, member.id, amount, check)
+        if not snipes:
+            await self.reply(ctx, f"There's nothing to snipe from {member}!")
+            return
+        if not ctx.guild.chunked:
+            await ctx.guild.chunk()
+        await self.reply(ctx, embeds=self.delete_embeds(ctx, snipes, show_channel=True))
+
+    def delete_embeds(
+        self, ctx: commands.Context, snipes: List[Record], show_channel: bool = False
+    ) -> List[discord.Embed]:
         embeds = []
-        for snipe in channelsnipes:
-            author = ctx.guild.get_member(snipe["author"])
-            content = snipe["content"]
-            if content == "":
-                description = (
-                    "No message content.\nThe deleted message may have been an image or an embed."
-                )
+        for snipe in snipes:
+            author = ctx.guild.get_member(snipe.author)
+            content = snipe.content
+            if snipe.attachments:
+                attachments = "\n".join(snipe.attachments)
+                description = f"{content}\n\n**Attachments:**\n{attachments}".strip()
+            elif content == "":
+                description = "No message content.\nThe deleted message may have been an embed."
             else:
                 description = content
 
             embed = discord.Embed(
                 description=description,
-                timestamp=snipe["timestamp"],
+                timestamp=datetime.fromtimestamp(snipe.created, tz=timezone.utc),
                 color=ctx.author.color,
             )
-            embed.set_footer(text=f"Sniped by: {ctx.author}")
+            footer = f"Sniped by: {ctx.author}"
+            if show_channel:
+                channel = ctx.guild.get_channel(snipe.channel[2])
+                footer += f" | #{channel}"
+            embed.set_footer(text=footer)
             if author:
                 embed.set_author(name=f"{author} ({author.id})", icon_url=author.avatar_url)
             else:
                 embed.set_author(name="Removed Member")
             embeds.append(embed)
-        await self.reply(ctx, embeds=embeds)
+        return embeds
 
     @staticmethod
     def get_content(content: str, limit: int = 1024):
@@ -251,14 +322,14 @@ class Snipe(commands.Cog):
             await ctx.guild.chunk()
         embeds = []
         for snipe in channelsnipes:
-            author = ctx.guild.get_member(snipe["author"])
+            author = ctx.guild.get_member(snipe.author)
 
             embed = discord.Embed(
-                timestamp=snipe["timestamp"],
+                timestamp=datetime.fromtimestamp(snipe.created, tz=timezone.utc),
                 color=ctx.author.color,
             )
-            old_content = self.get_content(snipe["old_content"])
-            new_content = self.get_content(snipe["new_content"])
+            old_content = self.get_content(snipe.old_content)
+            new_content = self.get_content(snipe.content)
             embed.add_field(name="Old Content:", value=old_content)
             embed.add_field(name="New Content:", value=new_content)
             embed.set_footer(text=f"Sniped by: {ctx.author}")
@@ -280,13 +351,11 @@ class Snipe(commands.Cog):
         """Enable or disable sniping.
 
         State must be a bool or one of the following: True/False, On/Off, Y/N"""
+        await self.set_guild_setting(ctx.guild, "toggle", state)
         if state:
-            await self.config.guild(ctx.guild).toggle.set(True)
             await self.reply(ctx, f"Sniping has been enabled in {ctx.guild}.")
         else:
-            await self.config.guild(ctx.guild).toggle.set(False)
             await self.reply(ctx, f"Sniping has been disabled in {ctx.guild}.")
-        await self.generate_cache()
 
     @snipeset.command()
     async def time(
@@ -307,9 +376,8 @@ class Snipe(commands.Cog):
         Defaults to seconds if no unit name used.
         """
         duration = time.total_seconds()
-        await self.config.guild(ctx.guild).timeout.set(duration)
+        await self.set_guild_setting(ctx.guild, "timeout", duration)
         await ctx.tick()
-        await self.generate_cache()
 
     @snipeset.command(name="max")
     async def _max(self, ctx: commands.Context, amount: int):
@@ -317,9 +385,7 @@ class Snipe(commands.Cog):
         if amount < 1 or amount > 10:
             await self.reply(ctx, "The max amount must be between 1 and 10.")
             return
-        await self.config.guild(ctx.guild).max.set(amount)
-        self.edit_cache[ctx.guild.id][ctx.channel.id] = deque(maxlen=amount)
-        self.delete_cache[ctx.guild.id][ctx.channel.id] = deque(maxlen=amount)
+        await self.set_guild_setting(ctx.guild, "max", amount)
         await ctx.tick()
 
     @snipeset.command()
@@ -344,3 +410,36 @@ class Snipe(commands.Cog):
         duration = time.total_seconds()
         await self.config.timer.set(duration)
         await ctx.tick()
+
+    @snipeset.command()
+    @commands.is_owner()
+    async def budget(self, ctx: commands.Context, entries: int, megabytes: float):
+        """Set how many snipes, and how much memory, may be cached across every server.
+
+        The least recently used channels are dropped when either limit is reached."""
+        if entries < 1 or megabytes <= 0:
+            await self.reply(ctx, "Both limits must be greater than 0.")
+            return
+        max_bytes = int(megabytes * 1024 * 1024)
+        await self.config.max_entries.set(entries)
+        await self.config.max_bytes.set(max_bytes)
+        self.store.max_entries = entries
+        self.store.max_bytes = max_bytes
+        self.store.enforce_budget()
+        await ctx.tick()
+
+    @snipeset.command()
+    @commands.is_owner()
+    async def stats(self, ctx: commands.Context):
+        """Show how much memory the snipe cache is using."""
+        stats = self.store.stats()
+        msg = (
+            f"Snipes cached:   {humanize_number(stats['entries'])} / {humanize_number(self.store.max_entries)}\n"
+            f"Memory (approx): {stats['bytes'] / 1024 / 1024:.2f} / {self.store.max_bytes / 1024 / 1024:.2f} MiB\n"
+            f"Channels:        {humanize_number(stats['channels'])}\n"
+            f"Expiry heap:     {humanize_number(stats['heap'])}\n"
+            f"Recent messages: {humanize_number(len(self.recent))} ({self.recent.bytes / 1024 / 1024:.2f} MiB)\n"
+            f"Expired:         {humanize_number(stats['expired'])}\n"
+            f"Evicted:         {humanize_number(stats['evicted'])}"
+        )
+        await self.reply(ctx, box(msg))
@@ -0,0 +1,256 @@
+import heapq
+import itertools
+import sys
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# ("delete" or "edit", guild id, channel id)
+ChannelKey = Tuple[str, int, int]
+
+DEFAULT_MAX_ENTRIES = 50_000
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+# rough size of a record, its heap entry and its index entry, excluding the strings
+RECORD_OVERHEAD = 256
+# messages kept for deletes that arrive without a cached message
+RECENT_SIZE = 10_000
+# longer content is cut, the snipe embeds couldn't show it anyway
+MAX_CONTENT = 2000
+
+
+def truncate(content: str) -> str:
+    return content if len(content) <= MAX_CONTENT else f"{content[:MAX_CONTENT - 3]}..."
+
+
+class Record:
+    """A sniped message. ``content`` is the new content for edits.
+
+    Only what the snipe commands show is kept: truncated content and attachment URLs.
+    """
+
+    __slots__ = (
+        "channel",
+        "message_id",
+        "author",
+        "content",
+        "old_content",
+        "attachments",
+        "created",
+        "size",
+        "seq",
+    )
+
+    def __init__(
+        self,
+        author: int,
+        content: str,
+        old_content: Optional[str] = None,
+        created: Optional[float] = None,
+        message_id: int = 0,
+        attachments: Sequence[str] = (),
+    ) -> None:
+        self.channel: Optional[ChannelKey] = None
+        self.message_id = message_id
+        self.author = author
+        self.content = truncate(content)
+        self.old_content = None if old_content is None else truncate(old_content)
+        self.attachments = tuple(attachments)
+        self.created = time.time() if created is None else created
+        self.seq = -1
+        self.size = (
+            RECORD_OVERHEAD
+            + sys.getsizeof(self.content)
+            + (sys.getsizeof(self.old_content) if old_content is not None else 0)
+            + sum(map(sys.getsizeof, self.attachments))
+        )
+
+    @classmethod
+    def from_message(cls, message, created: Optional[float] = None) -> "Record":
+        return cls(
+            message.author.id,
+            message.content,
+            created=created,
+            message_id=message.id,
+            attachments=[attachment.url for attachment in message.attachments],
+        )
+
+
+class SnipeStore:
+    """Every cached snipe, bounded by one global entry and byte budget.
+
+    Records are kept per channel for lookups and in a single heap ordered by expiry, so
+    expiring only pops from the head of the heap. When the budget is exceeded, the least
+    recently used channel is dropped whole. The heap only holds sequence numbers, removed
+    records are freed straight away and their heap entries skipped once they reach the head.
+    """
+
+    def __init__(
+        self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.channels: "OrderedDict[ChannelKey, Deque[Record]]" = OrderedDict()
+        self.expiries: List[Tuple[float, int]] = []
+        self.live: Dict[int, Record] = {}
+        # (cache type, guild id, author id) -> that author's records, oldest first
+        self.authors: Dict[Tuple[str, int, int], Dict[int, Record]] = {}
+        self._counter = itertools.count()
+        self.bytes = 0
+        self.expired = 0
+        self.evicted = 0
+
+    @property
+    def entries(self) -> int:
+        return len(self.live)
+
+    def __len__(self) -> int:
+        return len(self.live)
+
+    def _discard(self, record: Record):
+        if self.live.pop(record.seq, None) is None:
+            return
+        self.bytes -= record.size
+        author_key = (record.channel[0], record.channel[1], record.author)
+        records = self.authors.get(author_key)
+        if records is not None:
+            records.pop(record.seq, None)
+            if not records:
+                del self.authors[author_key]
+
+    def add(self, key: ChannelKey, record: Record, maxlen: int, timeout: float):
+        self.add_many(key, (record,), maxlen, timeout)
+
+    def add_many(self, key: ChannelKey, records: Iterable[Record], maxlen: int, timeout: float):
+        """Append records to a channel, oldest first, checking the budget once."""
+        records = list(records)[-maxlen:]
+        if not records:
+            return
+        queue = self.channels.get(key)
+        if queue is None:
+            queue = self.channels[key] = deque()
+        else:
+            self.channels.move_to_end(key)
+        for record in records:
+            record.channel = key
+            record.seq = next(self._counter)
+            self.live[record.seq] = record
+            self.authors.setdefault((key[0], key[1], record.author), {})[record.seq] = record
+            heapq.heappush(self.expiries, (record.created + timeout, record.seq))
+            self.bytes += record.size
+        queue.extend(records)
+        while len(queue) > maxlen:
+            self._discard(queue.popleft())
+        self.enforce_budget()
+        if len(self.expiries) > 2 * len(self.live) + 1024:
+            # mostly entries for records that were already sniped or evicted
+            self.expiries = [entry for entry in self.expiries if entry[1] in self.live]
+            heapq.heapify(self.expiries)
+
+    def enforce_budget(self):
+        while (self.entries > self.max_entries or self.bytes > self.max_bytes) and self.channels:
+            _, queue = self.channels.popitem(last=False)
+            for record in queue:
+                self._discard(record)
+                self.evicted += 1
+
+    def expire(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        expiries = self.expiries
+        while expiries and (expiries[0][0] <= now or expiries[0][1] not in self.live):
+            _, seq = heapq.heappop(expiries)
+            record = self.live.get(seq)
+            if record is None:
+                continue
+            self._discard(record)
+            self.expired += 1
+            queue = self.channels.get(record.channel)
+            if queue is not None:
+                # expiry follows insertion order within a channel unless the guild's timeout
+                # changed in between, so this is nearly always the leftmost record
+                try:
+                    queue.remove(record)
+                except ValueError:
+                    pass
+                if not queue:
+                    del self.channels[record.channel]
+
+    def pop(self, key: ChannelKey) -> Optional[Record]:
+        """Remove and return the newest record of a channel."""
+        queue = self.channels.get(key)
+        if not queue:
+            return None
+        self.channels.move_to_end(key)
+        record = queue.pop()
+        self._discard(record)
+        if not queue:
+            del self.channels[key]
+        return record
+
+    def pop_author(
+        self,
+        cache_type: str,
+        guild_id: int,
+        author_id: int,
+        amount: int,
+        check: Callable[[Record], bool],
+    ) -> List[Record]:
+        """Remove and return up to ``amount`` of an author's newest records passing ``check``."""
+        records = self.authors.get((cache_type, guild_id, author_id))
+        if not records:
+            return []
+        found = []
+        for record in reversed(records.values()):
+            if check(record):
+                found.append(record)
+                if len(found) >= amount:
+                    break
+        for record in found:
+            queue = self.channels[record.channel]
+            queue.remove(record)
+            if not queue:
+                del self.channels[record.channel]
+            self._discard(record)
+        return found
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": self.entries,
+            "bytes": self.bytes,
+            "channels": len(self.channels),
+            "heap": len(self.expiries),
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+class RecentMessages:
+    """Compact copies of the latest messages in guilds with sniping enabled.
+
+    Lets deletes of messages that discord.py no longer caches, which only arrive as raw
+    events, still be sniped.
+    """
+
+    def __init__(self, maxsize: int = RECENT_SIZE) -> None:
+        self.maxsize = maxsize
+        self.messages: "OrderedDict[int, Record]" = OrderedDict()
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def __contains__(self, message_id: int) -> bool:
+        return message_id in self.messages
+
+    def add(self, record: Record):
+        self.pop(record.message_id)
+        self.messages[record.message_id] = record
+        self.bytes += record.size
+        while len(self.messages) > self.maxsize:
+            _, oldest = self.messages.popitem(last=False)
+            self.bytes -= oldest.size
+
+    def pop(self, message_id: int) -> Optional[Record]:
+        record = self.messages.pop(message_id, None)
+        if record is not None:
+            self.bytes -= record.size
+        return record
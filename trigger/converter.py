@@ -0,0 +1,10 @@
+from redbot.core.commands import BadArgument, Converter
+
+
+class RegexFlag(Converter):
+    """The ``--regex`` flag of ``[p]trigger create``, left unconsumed when absent."""
+
+    async def convert(self, ctx, argument):
+        if argument.replace("—", "--").lower() != "--regex":
+            raise BadArgument()
+        return True
@@ -0,0 +1,52 @@
+import heapq
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+SCOPES = ("guild", "channel", "user")
+# cooldowns tracked at once, the one closest to ending is dropped beyond this
+MAX_ENTRIES = 50_000
+
+
+class CooldownStore:
+    """When each (guild, trigger, scope) may fire again, in monotonic time.
+
+    Expiries are also pushed onto a min-heap, so cooldowns of any length are swept from its
+    front once they have passed. Beyond ``maxsize`` the cooldown closest to ending is
+    dropped early.
+    """
+
+    def __init__(self, maxsize: int = MAX_ENTRIES) -> None:
+        self.maxsize = maxsize
+        self.entries: Dict[Hashable, float] = {}
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        # breaks ties between equal expiries, keys aren't necessarily comparable
+        self._counter = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _pop(self):
+        expires, _, key = heapq.heappop(self._heap)
+        # the key may have been restarted since this entry was pushed
+        if self.entries.get(key) == expires:
+            del self.entries[key]
+
+    def _expire(self, now: float):
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            self._pop()
+
+    def hit(self, key: Hashable, cooldown: float, now: Optional[float] = None) -> bool:
+        """Start the cooldown of ``key`` unless it is running, returning whether it wasn't."""
+        if now is None:
+            now = time.monotonic()
+        self._expire(now)
+        if key in self.entries:
+            return False
+        expires = now + cooldown
+        self.entries[key] = expires
+        self._counter += 1
+        heapq.heappush(self._heap, (expires, self._counter, key))
+        while len(self.entries) > self.maxsize:
+            self._pop()
+        return True
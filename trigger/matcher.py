@@ -0,0 +1,182 @@
+import logging
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .objects import REGEX_BUDGET, REGEX_TIMEOUT, TriggerObject
+
+log = logging.getLogger("red.flare.trigger")
+
+# regex timeouts before a trigger is disabled
+MAX_STRIKES = 3
+
+
+def is_word_char(char: str) -> bool:
+    """Mirror of the ``\\w`` class for a single character."""
+    return char.isalnum() or char == "_"
+
+
+def bounded(content: str, start: int, end: int) -> bool:
+    """Whether ``content[start:end]`` would satisfy ``\\b...\\b``."""
+    before = start > 0 and is_word_char(content[start - 1])
+    after = end < len(content) and is_word_char(content[end])
+    return before != is_word_char(content[start]) and after != is_word_char(content[end - 1])
+
+
+class Lane:
+    """An Aho-Corasick automaton over the trigger phrases of one case mode.
+
+    Each phrase maps to the triggers using it along with whether they need word
+    boundaries, so a phrase shared by several triggers is only searched for once.
+    """
+
+    __slots__ = ("words", "entries", "_goto", "_fail", "_output")
+
+    def __init__(self, phrases: Dict[str, List[Tuple[int, bool]]]) -> None:
+        self.words = list(phrases)
+        self.entries = [phrases[word] for word in self.words]
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[int, ...]] = [()]
+        self._build()
+
+    def __bool__(self) -> bool:
+        return bool(self.words)
+
+    def _build(self):
+        goto, fail, output = self._goto, self._fail, self._output
+        for index, word in enumerate(self.words):
+            state = 0
+            for char in word:
+                nxt = goto[state].get(char)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][char] = nxt
+                    goto.append({})
+                    fail.append(0)
+                    output.append(())
+                state = nxt
+            output[state] += (index,)
+
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in goto[state].items():
+                queue.append(nxt)
+                link = fail[state]
+                while link and char not in goto[link]:
+                    link = fail[link]
+                fail[nxt] = goto[link].get(char, 0)
+                output[nxt] += output[fail[nxt]]
+
+    def scan(self, content: str, found: Set[int]):
+        """Add the index of every trigger present in ``content`` to ``found``."""
+        goto, fail, output, words, entries = (
+            self._goto,
+            self._fail,
+            self._output,
+            self.words,
+            self.entries,
+        )
+        # phrases whose triggers have all been found already
+        done: Set[int] = set()
+        state = 0
+        for pos, char in enumerate(content):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in output[state]:
+                if index in done:
+                    continue
+                on_boundary = None
+                complete = True
+                for trigger, word_boundary in entries[index]:
+                    if trigger in found:
+                        continue
+                    if word_boundary:
+                        if on_boundary is None:
+                            end = pos + 1
+                            on_boundary = bounded(content, end - len(words[index]), end)
+                        if not on_boundary:
+                            complete = False
+                            continue
+                    found.add(trigger)
+                if complete:
+                    done.add(index)
+
+
+class TriggerMatcher:
+    """Every enabled trigger of a guild, compiled for a single pass over a message.
+
+    Case sensitive and case insensitive phrases live in separate automatons, the latter
+    scanning the lowercased message. Word boundary triggers always match case insensitively,
+    like they did when each trigger compiled its own pattern. The rare trigger that can't be
+    expressed as a phrase, like an empty one, falls back to its own check. Regex triggers are
+    kept apart, see ``search_patterns``.
+    """
+
+    __slots__ = ("triggers", "sensitive", "insensitive", "fallback", "patterns")
+
+    def __init__(self, triggers: Iterable[TriggerObject]) -> None:
+        self.triggers = [trigger for trigger in triggers if trigger.toggle]
+        sensitive: Dict[str, List[Tuple[int, bool]]] = {}
+        insensitive: Dict[str, List[Tuple[int, bool]]] = {}
+        self.fallback: List[int] = []
+        self.patterns: List[TriggerObject] = []
+        for index, trigger in enumerate(self.triggers):
+            phrase = trigger.trigger
+            if trigger.regex:
+                self.patterns.append(trigger)
+            elif not phrase:
+                self.fallback.append(index)
+            elif trigger.case_sensitive and not trigger.word_boundary:
+                sensitive.setdefault(phrase, []).append((index, False))
+            else:
+                insensitive.setdefault(phrase.lower(), []).append((index, trigger.word_boundary))
+        self.sensitive = Lane(sensitive)
+        self.insensitive = Lane(insensitive)
+
+    def __bool__(self) -> bool:
+        return bool(self.triggers)
+
+    def __repr__(self) -> str:
+        return (
+            f"<TriggerMatcher triggers={len(self.triggers)} "
+            f"sensitive={len(self.sensitive.words)} insensitive={len(self.insensitive.words)} "
+            f"patterns={len(self.patterns)}>"
+        )
+
+    def match(self, content: str) -> List[TriggerObject]:
+        """Return every enabled non-regex trigger present in ``content``, in creation order."""
+        found: Set[int] = set()
+        if self.sensitive:
+            self.sensitive.scan(content, found)
+        if self.insensitive:
+            self.insensitive.scan(content.lower(), found)
+        for index in self.fallback:
+            if self.triggers[index].matches(content):
+                found.add(index)
+        return [self.triggers[index] for index in sorted(found)]
+
+    def search_patterns(
+        self, content: str, budget: float = REGEX_BUDGET, timeout: float = REGEX_TIMEOUT
+    ) -> Tuple[List[TriggerObject], Optional[TriggerObject]]:
+        """Regex triggers found in ``content``, stopping once the time budget is spent.
+
+        No pattern is started after ``budget`` seconds, but every pattern that is started
+        gets the full ``timeout`` so a timeout is only ever blamed on the pattern that was
+        slow on its own. Stops at that pattern and returns it alongside the matches found
+        so far. Meant to run in a worker thread.
+        """
+        found = []
+        deadline = time.monotonic() + budget
+        for trigger in self.patterns:
+            if time.monotonic() >= deadline:
+                log.debug("Regex trigger budget spent, skipping the remaining patterns.")
+                break
+            try:
+                if trigger.search(content, timeout):
+                    found.append(trigger)
+            except TimeoutError:
+                return found, trigger
+        return found, None
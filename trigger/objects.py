@@ -1,6 +1,59 @@
-import datetime
 import random
 import re
+from typing import Dict, List, Tuple, Union
+
+import regex
+
+# seconds after which no further regex trigger is started for a message
+REGEX_BUDGET = 0.05
+# seconds each regex trigger may spend searching a message
+REGEX_TIMEOUT = 0.05
+PLACEHOLDER_RE = re.compile(r"{([^{}]+)\}")
+
+
+class Placeholder:
+    """A ``{name}`` or ``{name.attribute}`` lookup within a response."""
+
+    __slots__ = ("key", "first", "second", "raw")
+
+    # https://github.com/Cog-Creators/Red-DiscordBot/blob/V3/develop/redbot/cogs/customcom/customcom.py#L824
+    def __init__(self, result: str) -> None:
+        self.key = result
+        self.raw = "{" + result + "}"
+        self.first = self.second = None
+        parts = result.split(".")
+        # for security reasons internals are ignored
+        if len(parts) == 2 and not parts[1].startswith("_"):
+            self.first, self.second = parts
+
+    def render(self, objects: dict) -> str:
+        if self.key in objects:
+            return str(objects[self.key])
+        if self.first in objects:
+            return str(getattr(objects[self.first], self.second, self.raw))
+        return self.raw
+
+
+class Template:
+    """A response parsed once into literal text and placeholders.
+
+    For security reasons only specific objects are allowed.
+    """
+
+    __slots__ = ("segments",)
+
+    def __init__(self, response: str) -> None:
+        self.segments: List[Union[str, Placeholder]] = [
+            part if i % 2 == 0 else Placeholder(part)
+            for i, part in enumerate(PLACEHOLDER_RE.split(response))
+            if part
+        ]
+
+    def render(self, objects: Dict[str, object]) -> str:
+        return "".join(
+            segment if segment.__class__ is str else segment.render(objects)
+            for segment in self.segments
+        )
 
 
 class TriggerObject:
@@ -11,19 +64,22 @@ class TriggerObject:
         self.owner = kwargs.get("owner", None)
         self.guild = kwargs.get("guild", None)
         self.cooldown = kwargs.get("cooldown", 0)
-        self.timestamp = None
+        self.cooldown_scope = kwargs.get("cooldown_scope", "guild")
         self.uses = kwargs.get("uses", 0)
         self.toggle = kwargs.get("toggle", False)
         self.case_sensitive = kwargs.get("case_sensitive", True)
         self.word_boundary = kwargs.get("word_boundary", False)
+        self.regex = kwargs.get("regex", False)
         self.pattern = None
+        # regex timeouts since the trigger was loaded
+        self.strikes = 0
+        self.templates = [Template(response) for response in self.responses or ()]
 
-    def check(self, message):
-        if not self.toggle:
-            return False
-
+    def matches(self, content: str) -> bool:
+        """Whether ``content`` contains this trigger, ignoring the toggle and cooldown."""
+        if self.regex:
+            return self.search(content, REGEX_TIMEOUT)
         trigger = self.trigger
-        content = message.content
         if not self.case_sensitive:
             trigger = trigger.lower()
             content = content.lower()
@@ -31,36 +87,36 @@ class TriggerObject:
         if self.word_boundary:
             if self.pattern is None:
                 self.pattern = re.compile(rf"\b{re.escape(self.trigger.lower())}\b", flags=re.I)
-            if set(self.pattern.findall(content)):
-                if self.cooldown > 0:
-                    if self.timestamp is None:
-                        self.timestamp = datetime.datetime.now(tz=datetime.timezone.utc)
-                    else:
-                        now = datetime.datetime.now(tz=datetime.timezone.utc)
-                        diff = now - self.timestamp
-                        if diff.total_seconds() < self.cooldown:
-                            return False
-                        else:
-                            self.timestamp = now
-                return True
-        elif trigger in content:
-            if self.cooldown > 0:
-                if self.timestamp is None:
-                    self.timestamp = datetime.datetime.now(tz=datetime.timezone.utc)
-                else:
-                    now = datetime.datetime.now(tz=datetime.timezone.utc)
-                    diff = now - self.timestamp
-                    if diff.total_seconds() < self.cooldown:
-                        return False
-                    else:
-                        self.timestamp = now
-            return True
-        return False
+            return self.pattern.search(content) is not None
+        return trigger in content
+
+    @staticmethod
+    def compile_regex(pattern: str, case_sensitive: bool) -> "regex.Pattern":
+        """Compile a regex trigger, raising ``regex.error`` for invalid patterns."""
+        return regex.compile(pattern, flags=0 if case_sensitive else regex.I)
+
+    def search(self, content: str, timeout: float) -> bool:
+        """Search a regex trigger, raising ``TimeoutError`` once ``timeout`` is spent.
+
+        The GIL is released while searching so this can run in a worker thread.
+        """
+        if self.pattern is None:
+            self.pattern = self.compile_regex(self.trigger, self.case_sensitive)
+        return self.pattern.search(content, timeout=timeout, concurrent=True) is not None
+
+    def cooldown_key(self, message) -> Tuple[int, str, int]:
+        """The cooldown bucket ``message`` falls into for this trigger."""
+        if self.cooldown_scope == "channel":
+            target = message.channel.id
+        elif self.cooldown_scope == "user":
+            target = message.author.id
+        else:
+            target = 0
+        return message.guild.id, self.trigger_name, target
 
     async def respond(self, message):
-        response = random.choice(self.responses)
+        template = random.choice(self.templates)
         self.uses += 1
-        self.timestamp = datetime.datetime.now(tz=datetime.timezone.utc)
         objects = {
             "user": message.author,
             "uses": self.uses,
@@ -69,35 +125,7 @@ class TriggerObject:
             "message": message,
             "trigger": self.trigger_name,
         }
-        resp = self.transform_message(response, objects)
-        await message.channel.send(resp)
+        await message.channel.send(template.render(objects))
 
     def __repr__(self) -> str:
         return f"<TriggerObject trigger={self.trigger}>"
-
-    # https://github.com/Cog-Creators/Red-DiscordBot/blob/V3/develop/redbot/cogs/customcom/customcom.py#L824
-    @staticmethod
-    def transform_parameter(result, objects) -> str:
-        """
-        For security reasons only specific objects are allowed
-        Internals are ignored
-        """
-        raw_result = "{" + result + "}"
-        if result in objects:
-            return str(objects[result])
-        try:
-            first, second = result.split(".")
-        except ValueError:
-            return raw_result
-        if first in objects and not second.startswith("_"):
-            first = objects[first]
-        else:
-            return raw_result
-        return str(getattr(first, second, raw_result))
-
-    def transform_message(self, message, objects):
-        results = re.findall(r"{([^}]+)\}", message)
-        for result in results:
-            param = self.transform_parameter(result, objects)
-            message = message.replace("{" + result + "}", param)
-        return message
@@ -1,18 +1,29 @@
 import asyncio
 import contextlib
-from copy import deepcopy
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Set
 
 import discord
+import regex
 from redbot.core import Config, commands
 from redbot.core.utils.menus import DEFAULT_CONTROLS, menu
 from redbot.core.utils.predicates import MessagePredicate
 
-from .objects import TriggerObject
+from .converter import RegexFlag
+from .cooldowns import SCOPES, CooldownStore
+from .matcher import MAX_STRIKES, TriggerMatcher
+from .objects import REGEX_TIMEOUT, TriggerObject
+
+log = logging.getLogger("red.flare.trigger")
+
+MAX_PATTERN_LENGTH = 100
 
 
 class Trigger(commands.Cog):
 
-    __version__ = "0.2.0"
+    __version__ = "0.3.0"
     __author__ = "flare(flare#0001)"
 
     def format_help_for_context(self, ctx):
@@ -25,30 +36,55 @@ class Trigger(commands.Cog):
         self.config.register_guild(triggers={})
 
         self.triggers = {}
+        # guild id -> matcher over its enabled triggers, rebuilt lazily after any change
+        self.matchers = {}
+        # guild id -> trigger name -> fields changed in memory but not yet saved
+        self.dirty: Dict[int, Dict[str, Set[str]]] = {}
+        # regex triggers are searched off the event loop
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="trigger")
+        self.cooldowns = CooldownStore()
         self.bg_config_loop = asyncio.create_task(self.init_loop())
         with contextlib.suppress(Exception):
             self.bot.add_dev_env_value("trigger", lambda x: self)
 
-    async def init_loop(self):
-        await self.bot.wait_until_ready()
-        while True:
-            await asyncio.sleep(60)
-            await self.save_triggers()
-
     def cog_unload(self):
         self.bg_config_loop.cancel()
-        asyncio.create_task(self.save_triggers())
+        # the pending changes are taken now, anything changing afterwards is left unsaved
+        asyncio.create_task(self.save_triggers(self.take_dirty()))
+        self.executor.shutdown(wait=False)
         with contextlib.suppress(Exception):
             self.bot.remove_dev_env_value("trigger")
 
-    async def save_triggers(self):
-        for guild_id, triggers in self.triggers.items():
-            guild_triggers = {}
-            for trigger in triggers:
-                guild_triggers[trigger] = deepcopy(triggers[trigger].__dict__)
-                del guild_triggers[trigger]["timestamp"]
-                del guild_triggers[trigger]["pattern"]
-            await self.config.guild_from_id(guild_id).triggers.set(guild_triggers)
+    def mark_dirty(self, guild_id: int, trigger_name: str, field: str = "uses"):
+        self.dirty.setdefault(guild_id, {}).setdefault(trigger_name, set()).add(field)
+
+    def take_dirty(self) -> Dict[int, Dict[str, dict]]:
+        """Snapshot the values of every unsaved field and clear the dirty set."""
+        pending = {}
+        for guild_id, names in self.dirty.items():
+            triggers = self.triggers.get(guild_id, {})
+            changes = {
+                name: {field: getattr(triggers[name], field) for field in fields}
+                for name, fields in names.items()
+                if name in triggers
+            }
+            if changes:
+                pending[guild_id] = changes
+        self.dirty.clear()
+        return pending
+
+    async def save_triggers(self, pending: Dict[int, Dict[str, dict]]):
+        """Write the changed fields with a single config write per guild."""
+        for guild_id, changes in pending.items():
+            async with self.config.guild_from_id(guild_id).triggers() as triggers:
+                for name, fields in changes.items():
+                    # deleted since it was marked
+                    if name in triggers:
+                        triggers[name].update(fields)
+
+    async def flush(self):
+        if self.dirty:
+            await self.save_triggers(self.take_dirty())
 
     async def init_loop(self):
         await self.bot.wait_until_ready()
@@ -58,11 +94,13 @@ class Trigger(commands.Cog):
                 if guild_id not in self.triggers:
                     self.triggers[guild_id] = {}
                 self.triggers[guild_id][trigger] = TriggerObject(
-                    **guild_triggers["triggers"][trigger]
+                    name=trigger, **guild_triggers["triggers"][trigger]
                 )
+            self.matchers.pop(guild_id, None)
         while True:
             await asyncio.sleep(60)
-            await self.save_triggers()
+            # shielded so unloading mid-write doesn't drop the changes already taken
+            await asyncio.shield(self.flush())
 
     @commands.Cog.listener()
     async def on_message(self, message):
@@ -71,10 +109,62 @@ class Trigger(commands.Cog):
         if message.guild is None:
             return
         guild = message.guild
-        for trigger in self.triggers.get(guild.id, {}):
-            obj = self.triggers[guild.id][trigger]
-            if obj.check(message):
+        matcher = self.matchers.get(guild.id)
+        if matcher is None:
+            triggers = self.triggers.get(guild.id)
+            if not triggers:
+                return
+            matcher = self.matchers[guild.id] = TriggerMatcher(triggers.values())
+        triggered = matcher.match(message.content)
+        if matcher.patterns:
+            found, timed_out = await asyncio.get_running_loop().run_in_executor(
+                self.executor, matcher.search_patterns, message.content
+            )
+            triggered.extend(found)
+            if timed_out is not None:
+                await self.strike(guild, timed_out)
+        now = time.monotonic()
+        for obj in triggered:
+            if obj.cooldown <= 0 or self.cooldowns.hit(
+                obj.cooldown_key(message), obj.cooldown, now
+            ):
                 await obj.respond(message)
+                self.mark_dirty(guild.id, obj.trigger_name)
+
+    async def strike(self, guild, trigger):
+        """Count a regex timeout against a trigger, disabling it after too many."""
+        trigger.strikes += 1
+        log.warning(
+            f"Regex trigger {trigger.trigger_name!r} in guild {guild.id} timed out "
+            f"({trigger.strikes}/{MAX_STRIKES})."
+        )
+        if trigger.strikes < MAX_STRIKES or not trigger.toggle:
+            return
+        trigger.toggle = False
+        self.mark_dirty(guild.id, trigger.trigger_name, "toggle")
+        self.matchers.pop(guild.id, None)
+        owner = guild.get_member(trigger.owner)
+        if owner is not None:
+            with contextlib.suppress(discord.HTTPException):
+                await owner.send(
+                    f"Your regex trigger `{trigger.trigger_name}` in {guild} has been disabled "
+                    f"after timing out {MAX_STRIKES} times. Simplify the pattern and enable it "
+                    "again with the trigger toggle command."
+                )
+
+    def validate_pattern(self, pattern: str, case_sensitive: bool) -> Optional[str]:
+        """Return why ``pattern`` cannot be used as a regex trigger, if it can't."""
+        if len(pattern) > MAX_PATTERN_LENGTH:
+            return f"Patterns cannot be longer than {MAX_PATTERN_LENGTH} characters."
+        try:
+            compiled = TriggerObject.compile_regex(pattern, case_sensitive)
+        except regex.error as e:
+            return f"Invalid regex: {e}"
+        try:
+            if compiled.search("", timeout=REGEX_TIMEOUT) is not None:
+                return "That pattern matches every message."
+        except TimeoutError:
+            return "That pattern takes too long to run."
 
     @commands.group()
     @commands.guild_only()
@@ -85,10 +175,20 @@ class Trigger(commands.Cog):
         """
 
     @trigger.command()
-    async def create(self, ctx, trigger_name: str, *, triggered_by: str):
+    async def create(
+        self,
+        ctx,
+        use_regex: Optional[RegexFlag],
+        trigger_name: str,
+        *,
+        triggered_by: str,
+    ):
         """
         Create a trigger.
 
+        Pass `--regex` before the name to match a regular expression instead of text.
+        Regexes that repeatedly take too long to search are disabled.
+
         Variables can be used within the responses.
         user: The user that triggered the trigger.
         channel: The channel the trigger was triggered in.
@@ -104,6 +204,11 @@ class Trigger(commands.Cog):
         if trigger_name in triggers:
             await ctx.send("Trigger already exists.")
             return
+        if use_regex:
+            error = self.validate_pattern(triggered_by, case_sensitive=False)
+            if error:
+                await ctx.send(error)
+                return
         responses = []
         await ctx.send(
             "Every message you send will be counted as a response. To exit or finish adding responses, type `exit`."
@@ -127,11 +232,12 @@ class Trigger(commands.Cog):
                 "owner": ctx.author.id,
                 "guild": ctx.guild.id,
                 "cooldown": 0,
-                "timestamp": None,
+                "cooldown_scope": "guild",
                 "uses": 0,
                 "toggle": True,
                 "case_sensitive": False,
                 "word_boundary": False,
+                "regex": bool(use_regex),
             }
             await self.update_trigger(ctx.guild, trigger_name, triggers[trigger_name])
 
@@ -150,6 +256,8 @@ class Trigger(commands.Cog):
             del triggers[trigger_name]
         if trigger_name in self.triggers.get(ctx.guild.id, {}):
             del self.triggers[ctx.guild.id][trigger_name]
+            self.matchers.pop(ctx.guild.id, None)
+        self.dirty.get(ctx.guild.id, {}).pop(trigger_name, None)
         await ctx.send("Trigger deleted.")
 
     @trigger.command(name="list")
@@ -157,7 +265,7 @@ class Trigger(commands.Cog):
         """
         List all triggers.
         """
-        await self.save_triggers()
+        await self.flush()
         triggers = await self.config.guild(ctx.guild).triggers()
         if not triggers:
             await ctx.send("No triggers found.")
@@ -165,9 +273,15 @@ class Trigger(commands.Cog):
         pages = []
         for trigger in triggers:
             responses = "\n".join(triggers[trigger]["responses"])
-            msg = f"**Triggered By:** {triggers[trigger]['trigger']}\n**Uses:** {triggers[trigger]['uses']}\n**Cooldown:** {triggers[trigger]['cooldown']} seconds\n**Responses:**\n {responses}"
+            triggered_by = triggers[trigger]["trigger"]
+            if triggers[trigger].get("regex", False):
+                triggered_by = f"{triggered_by} (regex)"
+            cooldown = f"{triggers[trigger]['cooldown']} seconds"
+            if triggers[trigger]["cooldown"]:
+                cooldown += f" per {triggers[trigger].get('cooldown_scope', 'guild')}"
+            msg = f"**Triggered By:** {triggered_by}\n**Uses:** {triggers[trigger]['uses']}\n**Cooldown:** {cooldown}\n**Responses:**\n {responses}"
             if len(msg) > 2000:
-                msg = f"**Triggered By:** {triggers[trigger]['trigger']}\n**Uses:** {triggers[trigger]['uses']}\n**Cooldown:** {triggers[trigger]['cooldown']} seconds\n**Responses:**\n *Responses Truncated*"
+                msg = f"**Triggered By:** {triggered_by}\n**Uses:** {triggers[trigger]['uses']}\n**Cooldown:** {cooldown}\n**Responses:**\n *Responses Truncated*"
             embed = discord.Embed(title=trigger, description=msg, color=await ctx.embed_color())
             user = ctx.guild.get_member(triggers[trigger]["owner"])
             if user:
@@ -184,6 +298,8 @@ class Trigger(commands.Cog):
         Toggle a trigger.
         """
         trigger_name = trigger_name.lower()
+        # a trigger may have been disabled in memory for timing out
+        await self.flush()
         async with self.config.guild(ctx.guild).triggers() as triggers:
             if trigger_name not in triggers:
                 await ctx.send("Trigger does not exist.")
@@ -212,24 +328,41 @@ class Trigger(commands.Cog):
             if trigger_name not in triggers:
                 await ctx.send("Trigger does not exist.")
                 return
+            if triggers[trigger_name].get("regex", False):
+                error = self.validate_pattern(
+                    triggered_by, triggers[trigger_name].get("case_sensitive", True)
+                )
+                if error:
+                    await ctx.send(error)
+                    return
             triggers[trigger_name]["trigger"] = triggered_by
             await self.update_trigger(ctx.guild, trigger_name, triggers[trigger_name])
         await ctx.tick()
 
     @edit.command()
-    async def cooldown(self, ctx, trigger_name: str, seconds: int):
+    async def cooldown(self, ctx, trigger_name: str, seconds: int, scope: str = None):
         """
         Set the cooldown for a trigger.
+
+        The scope is one of `guild`, `channel` or `user` and decides whether the cooldown is
+        shared across the guild or kept per channel or per user. Defaults to the current scope.
         """
         if seconds < 0:
             await ctx.send("Cooldown cannot be negative.")
             return
+        if scope is not None:
+            scope = scope.lower()
+            if scope not in SCOPES:
+                await ctx.send(f"Scope must be one of {', '.join(SCOPES)}.")
+                return
         trigger_name = trigger_name.lower()
         async with self.config.guild(ctx.guild).triggers() as triggers:
             if trigger_name not in triggers:
                 await ctx.send("Trigger does not exist.")
                 return
             triggers[trigger_name]["cooldown"] = seconds
+            if scope is not None:
+                triggers[trigger_name]["cooldown_scope"] = scope
             await self.update_trigger(ctx.guild, trigger_name, triggers[trigger_name])
         await ctx.tick()
 
@@ -294,4 +427,11 @@ class Trigger(commands.Cog):
     async def update_trigger(self, guild, trigger_name, trigger_data):
         if guild.id not in self.triggers:
             self.triggers[guild.id] = {}
-        self.triggers[guild.id][trigger_name] = TriggerObject(**trigger_data)
+        current = self.triggers[guild.id].get(trigger_name)
+        if current is not None:
+            # keep changes not saved yet, callers write trigger_data back to config
+            trigger_data["uses"] = current.uses
+            for field in self.dirty.get(guild.id, {}).pop(trigger_name, ()):
+                trigger_data[field] = getattr(current, field)
+        self.triggers[guild.id][trigger_name] = TriggerObject(name=trigger_name, **trigger_data)
+        self.matchers.pop(guild.id, None)